@@ -0,0 +1,44 @@
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+
+class AdmissionControl:
+    """Caps the number of inference requests admitted at once.
+
+    Past `max_pending` new requests are turned away with 429 and a
+    Retry-After header rather than queueing until the caller (the Django
+    side, with 5-60s timeouts) has already given up. Only used from the
+    event loop thread, so plain counters are enough.
+    """
+
+    def __init__(self, max_pending, retry_after):
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="taxonomy service busy",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self.pending += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+
+
+class IVFIndex:
+    """Approximate nearest-neighbour index over unit-length vectors (IVF-Flat).
+
+    Vectors are bucketed by their nearest coarse centroid (spherical k-means).
+    A search only scans the `nprobe` closest buckets, so the cost grows with
+    n / nlist * nprobe instead of n. Below `min_train` vectors the index is
+    just an exact brute-force scan.
+
+    Each vector carries an integer label (the category index).
+    """
+
+    def __init__(self, dim, nlist=0, nprobe=8, min_train=4096, seed=0):
+        self.dim = dim
+        self.nlist = nlist          # 0 = sqrt(n) at train time
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self._rng = np.random.default_rng(seed)
+
+        self.n = 0
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._labels = np.zeros(1024, dtype=np.int32)
+        # (coarse centroids nlist x dim, per centroid a list of row ids),
+        # swapped as one so a search never pairs a quantizer with lists of
+        # another; coarse is None while untrained
+        self._ivf = (None, [])
+        self.meta = {}
+
+    @property
+    def coarse(self):
+        return self._ivf[0]
+
+    @property
+    def lists(self):
+        return self._ivf[1]
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.n]
+
+    @property
+    def labels(self):
+        return self._labels[:self.n]
+
+    def __len__(self):
+        return self.n
+
+    # ---------- Build / insert ----------
+
+    def build(self, vectors, labels):
+        self.n = 0
+        self._ivf = (None, [])
+        self.add(vectors, labels)
+
+    def train(self, iters=10, sample=50000):
+        """(Re)fit the coarse quantizer and reassign every vector."""
+        x = self.vectors
+        nlist = self.nlist or max(1, int(np.sqrt(self.n)))
+        if len(x) > sample:
+            x = x[self._rng.choice(len(x), sample, replace=False)]
+
+        coarse = x[self._rng.choice(len(x), nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = (x @ coarse.T).argmax(axis=1)
+            for j in range(nlist):
+                members = x[assign == j]
+                if len(members):
+                    c = members.sum(axis=0)
+                    coarse[j] = c / (np.linalg.norm(c) or 1.0)
+
+        assign = (self.vectors @ coarse.T).argmax(axis=1)
+        self._ivf = (coarse, [list(np.flatnonzero(assign == j)) for j in range(nlist)])
+
+    def add(self, vectors, labels):
+        """Append vectors; O(d * nlist) each once trained."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+
+        end = self.n + len(vectors)
+        if end > len(self._vectors):
+            cap = max(end, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (cap, self.dim))
+            self._labels = np.resize(self._labels, cap)
+        self._vectors[self.n:end] = vectors
+        self._labels[self.n:end] = labels
+
+        coarse, lists = self._ivf
+        if coarse is not None:
+            for row, j in zip(range(self.n, end), (vectors @ coarse.T).argmax(axis=1)):
+                lists[j].append(row)
+        self.n = end
+
+        # Grown past the brute-force size through inserts: train once
+        if self.coarse is None and self.n >= self.min_train:
+            self.train()
+
+    # ---------- Query ----------
+
+    def search(self, queries, k):
+        """Return (ids, sims), each m x k, best first. Rows with fewer than k
+        candidates are padded with id -1 / sim -inf."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        coarse, lists = self._ivf
+        if coarse is None:
+            # Exact scan, fully vectorized
+            all_sims = queries @ self.vectors.T
+            kk = min(k, self.n)
+            if kk:
+                top = np.argpartition(-all_sims, kk - 1, axis=1)[:, :kk]
+                top_sims = np.take_along_axis(all_sims, top, axis=1)
+                order = np.argsort(-top_sims, axis=1)
+                ids[:, :kk] = np.take_along_axis(top, order, axis=1)
+                sims[:, :kk] = np.take_along_axis(top_sims, order, axis=1)
+            return ids, sims
+
+        nprobe = min(self.nprobe, len(coarse))
+        probes = np.argpartition(-(queries @ coarse.T), nprobe - 1, axis=1)[:, :nprobe]
+        for i, q in enumerate(queries):
+            cand = np.fromiter((r for j in probes[i] for r in lists[j]), dtype=np.int64)
+            if not len(cand):
+                continue
+            s = self._vectors[cand] @ q
+            kk = min(k, len(cand))
+            top = np.argpartition(-s, kk - 1)[:kk]
+            top = top[np.argsort(-s[top])]
+            ids[i, :kk] = cand[top]
+            sims[i, :kk] = s[top]
+        return ids, sims
+
+    def vote(self, queries, k, n_labels, depth):
+        """k-NN vote over the labels of the k nearest neighbours.
+
+        Returns, per query, (labels, raw scores) for up to `depth` labels,
+        best first. A label's raw score is its closest neighbour's
+        similarity, on the same scale as a centroid cosine, and labels are
+        ranked by that same score, so an exact match in a small category
+        beats a big category's many near misses. Ties go to the label with
+        more summed similarity among the neighbours.
+        """
+        ids, sims = self.search(queries, k)
+        out = []
+        for row_ids, row_sims in zip(ids, sims):
+            ok = row_ids >= 0
+            labels = self._labels[row_ids[ok]]
+            weight = np.bincount(labels, weights=row_sims[ok], minlength=n_labels)
+            best = np.full(n_labels, -np.inf)
+            np.maximum.at(best, labels, row_sims[ok])
+            voted = np.flatnonzero(np.isfinite(best))
+            voted = voted[np.lexsort((-weight[voted], -best[voted]))][:depth]
+            out.append((voted.tolist(), best[voted].tolist()))
+        return out
+
+    # ---------- Snapshot ----------
+
+    def save(self, path, **meta):
+        """Write vectors, labels and the trained quantizer to `path` (.npz)."""
+        coarse, lists = self._ivf
+        lists = lists if coarse is not None else []
+        self.meta = meta
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh,
+                vectors=self.vectors,
+                labels=self.labels,
+                coarse=coarse if coarse is not None else np.zeros((0, self.dim), np.float32),
+                list_sizes=np.array([len(l) for l in lists], dtype=np.int64),
+                list_rows=np.array([r for l in lists for r in l], dtype=np.int64),
+                meta=np.array(json.dumps(meta)),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, nprobe=8, min_train=4096):
+        """Restore a save()d index as is; the quantizer isn't retrained."""
+        data = np.load(path)
+        index = cls(data["vectors"].shape[1], nprobe=nprobe, min_train=min_train)
+        index._vectors = np.array(data["vectors"], dtype=np.float32)
+        index._labels = np.array(data["labels"], dtype=np.int32)
+        index.n = len(index._vectors)
+        if len(data["coarse"]):
+            coarse = np.array(data["coarse"], dtype=np.float32)
+            index.nlist = len(coarse)
+            rows = data["list_rows"].tolist()
+            bounds = np.concatenate([[0], np.cumsum(data["list_sizes"])])
+            index._ivf = (coarse, [rows[a:b] for a, b in zip(bounds[:-1], bounds[1:])])
+        index.meta = json.loads(str(data["meta"]))
+        return index
@@ -0,0 +1,87 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Gathers concurrent single-item calls into one batched call.
+
+    `submit(item)` queues the item and waits. A worker task collects items
+    for up to `max_wait_ms` or until `max_batch` are queued, runs
+    `fn(items) -> results` once in `executor`, and resolves each caller's
+    future with its own result.
+    """
+
+    def __init__(self, fn, max_batch=32, max_wait_ms=5, executor=None):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.last_batch_size = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task.done():
+            # The worker is bound to the loop it was started on (one per
+            # process under uvicorn; test clients may spin up several)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        fut = loop.create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up (client disconnect) don't need a result
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "last_batch_size": self.last_batch_size,
+        }
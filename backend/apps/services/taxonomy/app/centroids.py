@@ -0,0 +1,89 @@
+import torch
+import torch.nn.functional as F
+
+
+class CentroidStore:
+    """Per-category example embeddings plus running sums/counts.
+
+    A category centroid is the mean of the embeddings of its name and all of
+    its examples. Keeping the sum and count per row means a new example only
+    has to be encoded once and its centroid row refreshed in O(d), instead of
+    re-encoding the whole taxonomy.
+    """
+
+    def __init__(self, encode):
+        # encode(list[str]) -> tensor (n x d)
+        self._encode = encode
+        self.examples = []      # per category: list of 1-d tensors
+        self.sums = None        # n_categories x d
+        self.counts = None      # n_categories
+        self.centroids = None   # n_categories x d  (sums / counts)
+        self.normed = None      # centroids scaled to unit length, for scoring
+
+    def rebuild(self, taxonomy):
+        """Full re-encode of every category. Only used at startup or on an
+        explicit admin rebuild."""
+        texts, owners = [], []
+        for idx, c in enumerate(taxonomy):
+            for t in [c["name"]] + c.get("examples", []):
+                texts.append(t)
+                owners.append(idx)
+
+        # One batched encode for the whole taxonomy
+        emb = self._encode(texts)
+
+        examples = [[] for _ in taxonomy]
+        for row, idx in zip(emb, owners):
+            examples[idx].append(row)
+
+        self.examples = examples
+        self.sums = torch.stack([torch.stack(rows).sum(dim=0) for rows in examples])
+        self.counts = torch.tensor([len(rows) for rows in examples], dtype=self.sums.dtype)
+        self.centroids = self.sums / self.counts.unsqueeze(1)
+        self.normed = F.normalize(self.centroids, dim=1)
+        return self.centroids
+
+    def extend(self, examples, categories):
+        """Add examples to existing rows and append rows for new categories.
+
+        `examples` maps a row idx to its new example texts, `categories` is a
+        list of (name, example texts) for categories that don't exist yet.
+        Everything is encoded in one call before anything changes, so a
+        failed encode leaves the store as it was, and each touched centroid
+        row is refreshed once however many examples it got.
+        """
+        texts = [t for rows in examples.values() for t in rows]
+        for name, rows in categories:
+            texts.extend([name] + list(rows))
+        if not texts:
+            return self.centroids
+        emb = self._encode(texts).to(self.sums.device, self.sums.dtype)
+
+        pos = 0
+        for idx, rows in examples.items():
+            new = emb[pos:pos + len(rows)]
+            pos += len(rows)
+            self.examples[idx].extend(new)
+            self.sums[idx] += new.sum(dim=0)
+            self.counts[idx] += len(rows)
+        if examples:
+            touched = list(examples)
+            self.centroids[touched] = self.sums[touched] / self.counts[touched].unsqueeze(1)
+            self.normed[touched] = F.normalize(self.centroids[touched], dim=1)
+
+        if categories:
+            sums, counts = [], []
+            for name, rows in categories:
+                new = emb[pos:pos + 1 + len(rows)]
+                pos += 1 + len(rows)
+                self.examples.append(list(new))
+                sums.append(new.sum(dim=0))
+                counts.append(len(new))
+            sums = torch.stack(sums)
+            counts = torch.tensor(counts, dtype=self.counts.dtype)
+            centroids = sums / counts.unsqueeze(1)
+            self.sums = torch.cat([self.sums, sums])
+            self.counts = torch.cat([self.counts, counts])
+            self.centroids = torch.cat([self.centroids, centroids])
+            self.normed = torch.cat([self.normed, F.normalize(centroids, dim=1)])
+        return self.centroids
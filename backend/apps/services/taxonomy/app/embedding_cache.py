@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk store of text embeddings.
+
+    Layout of `root`:
+      meta.json    model name, dtype and embedding dim the store was built with
+      keys.txt     one sha1(text) per line; line i is row i of vectors.bin
+      vectors.bin  raw float32/float16 matrix, read back as a memmap
+
+    Both files are append-only, so adding an embedding is O(d). If the model
+    name or dtype in meta.json doesn't match, these three files are deleted
+    and rebuilt; anything else in `root` is left alone.
+    """
+
+    def __init__(self, root, model_name, encode, dtype="float32"):
+        # encode(list[str]) -> np.ndarray (n x d)
+        self.root = root
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self._encode = encode
+
+        self.meta_path = os.path.join(root, "meta.json")
+        self.keys_path = os.path.join(root, "keys.txt")
+        self.vectors_path = os.path.join(root, "vectors.bin")
+
+        self.dim = None
+        self.index = {}        # text hash -> row
+        self._vectors = None   # np.memmap (rows x dim)
+        self._load()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self.index)
+
+    def _load(self):
+        meta = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+
+        if not meta or meta.get("model") != self.model_name or meta.get("dtype") != self.dtype.name:
+            # Different model (or first run): nothing on disk is usable.
+            # Only the store's own files go, the directory may hold others
+            os.makedirs(self.root, exist_ok=True)
+            for path in (self.meta_path, self.keys_path, self.vectors_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return
+
+        self.dim = meta["dim"]
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as fh:
+                keys = fh.read().split()
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "wb").close()
+
+        # Rows past the end of either file come from an interrupted append;
+        # trim both so that line i of keys.txt is row i of vectors.bin again
+        row_bytes = self.dim * self.dtype.itemsize
+        rows = min(len(keys), os.path.getsize(self.vectors_path) // row_bytes)
+        if rows < len(keys):
+            with open(self.keys_path, "w", encoding="utf-8") as fh:
+                fh.write("".join(k + "\n" for k in keys[:rows]))
+        os.truncate(self.vectors_path, rows * row_bytes)
+
+        self.index = {k: i for i, k in enumerate(keys[:rows])}
+        self._remap(rows)
+
+    def _remap(self, rows):
+        if rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+
+    def _append(self, keys, emb):
+        emb = np.ascontiguousarray(emb, dtype=self.dtype)
+        if self.dim is None:
+            self.dim = emb.shape[1]
+            with open(self.meta_path, "w", encoding="utf-8") as fh:
+                json.dump({"model": self.model_name, "dtype": self.dtype.name, "dim": self.dim}, fh)
+
+        start = len(self.index)
+
+        # Vectors first, then keys: a key on disk always has its row written
+        with open(self.vectors_path, "ab") as fh:
+            fh.write(emb.tobytes())
+        with open(self.keys_path, "a", encoding="utf-8") as fh:
+            fh.write("".join(k + "\n" for k in keys))
+
+        for i, k in enumerate(keys):
+            self.index[k] = start + i
+        self._remap(start + len(keys))
+
+    def encode(self, texts):
+        """Return embeddings for `texts`, encoding only the ones not on disk."""
+        keys = [self.key(t) for t in texts]
+
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in self.index and k not in missing:
+                missing[k] = t
+        if missing:
+            self._append(list(missing), self._encode(list(missing.values())))
+
+        rows = [self.index[k] for k in keys]
+        return torch.from_numpy(np.asarray(self._vectors[rows], dtype=np.float32))
@@ -0,0 +1,32 @@
+import torch
+from sentence_transformers import SentenceTransformer
+
+# Every backend returns an object with SentenceTransformer's encode(), so the
+# call sites in main.py don't care which one is loaded.
+BACKENDS = ("torch", "int8", "onnx")
+
+
+def load_encoder(model_name, backend="torch"):
+    """Load `model_name` with the given inference backend.
+
+    torch  full fp32 PyTorch (default)
+    int8   PyTorch with nn.Linear layers dynamically quantized to int8 (CPU)
+    onnx   ONNX Runtime; the model is exported on first load. Needs
+           sentence-transformers[onnx]>=3.2 (optimum[onnxruntime]), as in
+           requirements.txt
+    """
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    if backend == "int8":
+        model = SentenceTransformer(model_name, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(model_name, backend="onnx")
+        except ImportError as e:
+            raise RuntimeError('ENCODER_BACKEND=onnx requires `pip install "optimum[onnxruntime]"`') from e
+
+    raise ValueError(f"unknown encoder backend {backend!r}, expected one of {BACKENDS}")
@@ -1,18 +1,53 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import os, json
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio, copy, os, json, hashlib, time
 import torch
+import torch.nn.functional as F
 import spacy
-from sentence_transformers import SentenceTransformer, util
 from fastapi.middleware.cors import CORSMiddleware
 
+from admission import AdmissionControl
+from ann import IVFIndex
+from batcher import MicroBatcher
+from centroids import CentroidStore
+from embedding_cache import EmbeddingCache
+from encoders import load_encoder
+from normalize import normalize
+from query_cache import QueryCache
+
 APP_DIR = os.path.dirname(__file__)
 TAX_PATH = os.path.join(APP_DIR, "taxonomy.json")
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(APP_DIR, "embeddings_cache"))
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float32")  # or float16
+ANN_SNAPSHOT = os.getenv("ANN_SNAPSHOT", os.path.join(APP_DIR, "ann_index.npz"))
 
 app = FastAPI(title="Taxonomy Service (Improved)")
 
 LOW_SCORE_THRESHOLD = 0.6
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "50000"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))  # seconds
+TOP_K_DEPTH = int(os.getenv("TOP_K_DEPTH", "5"))  # categories kept per cached query
+# "centroid": one mean vector per category, "knn": vote over individual examples
+MATCH_MODE = os.getenv("MATCH_MODE", "centroid")
+KNN_K = int(os.getenv("KNN_K", "10"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))      # 0 = sqrt(#examples)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_MIN_TRAIN = int(os.getenv("ANN_MIN_TRAIN", "4096"))  # exact scan below this
+# /match micro-batching: wait up to MATCH_BATCH_WAIT_MS for MATCH_BATCH_SIZE texts
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", "32"))
+MATCH_BATCH_WAIT_MS = float(os.getenv("MATCH_BATCH_WAIT_MS", "5"))
+# Inference runs on its own bounded pool; taxonomy writes/rebuilds on a single
+# writer thread so they never hold up /match or /classify/bulk
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "64"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "2"))
+NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "256"))
+NER_N_PROCESS = int(os.getenv("NER_N_PROCESS", "1"))
+# Only doc.ents is used; everything else in the pipeline is dead weight
+NER_EXCLUDE = [c for c in os.getenv("NER_EXCLUDE", "tagger,parser,lemmatizer,attribute_ruler,senter").split(",") if c]
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,20 +58,29 @@ app.add_middleware(
 
 # Load spaCy
 try:
-    nlp = spacy.load("en_core_web_sm")
+    nlp = spacy.load("en_core_web_sm", exclude=NER_EXCLUDE)
 except:
     nlp = spacy.blank("en")
 
-# Load sentence-transformer
+# Load sentence-transformer: torch (fp32) | int8 | onnx, see encoders.py
 MODEL_NAME = os.getenv("SENTE_MODEL", "all-mpnet-base-v2")
-model = SentenceTransformer(MODEL_NAME)
-
-# Load or create taxonomy
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+model = load_encoder(MODEL_NAME, ENCODER_BACKEND)
+# Backends produce slightly different vectors; cached ones must not mix
+ENCODER_KEY = f"{MODEL_NAME}:{ENCODER_BACKEND}"
+
+# Load or create taxonomy. The file is {"version": n, "categories": [...]},
+# so the version write endpoints return survives a restart; a bare list
+# (older files) starts at version 0.
+_initial_version = 0
 if os.path.exists(TAX_PATH):
     with open(TAX_PATH, "r", encoding="utf-8") as fh:
-        taxonomy = json.load(fh)
+        _initial_taxonomy = json.load(fh)
+    if isinstance(_initial_taxonomy, dict):
+        _initial_version = _initial_taxonomy.get("version", 0)
+        _initial_taxonomy = _initial_taxonomy["categories"]
 else:
-    taxonomy = [
+    _initial_taxonomy = [
         {"id": "1", "name": "Food & Drink", "examples": ["coffee", "restaurant", "cafe", "lunch"]},
         {"id": "2", "name": "Groceries", "examples": ["supermarket", "grocery", "daily essentials"]},
         {"id": "3", "name": "Transport", "examples": ["uber", "taxi", "bus", "fuel"]},
@@ -44,110 +88,531 @@ else:
         {"id": "5", "name": "Salary", "examples": ["salary", "payroll"]},
     ]
     with open(TAX_PATH, "w", encoding="utf-8") as fh:
-        json.dump(taxonomy, fh, indent=2)
+        json.dump({"version": _initial_version, "categories": _initial_taxonomy}, fh, indent=2)
 
 
 # ---------- Embedding Preparation (Centroid Method) ----------
 
-def prepare_embeddings():
-    cat_embeds = []
-    cat_texts = []
+def encode_texts(texts):
+    return model.encode(texts, convert_to_tensor=True)  # shape: n x 768
+
+
+# Taxonomy examples are encoded through an on-disk cache so a restart only
+# encodes examples it hasn't seen before (see embedding_cache.py)
+_embed_cache = EmbeddingCache(
+    EMBED_CACHE_DIR,
+    ENCODER_KEY,
+    lambda texts: model.encode(texts, convert_to_numpy=True),
+    dtype=EMBED_CACHE_DTYPE,
+)
+
+
+def encode_examples(texts):
+    # Examples go through the same normalization as queries
+    return _embed_cache.encode([normalize(t) for t in texts]).to(model.device)
+
 
-    for c in taxonomy:
-        # Expand text to improve similarity performance
-        examples = c.get("examples", [])
-        texts = [c["name"]] + examples
+# Query embeddings + classifications keyed on normalized text, see query_cache.py
+_query_cache = QueryCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
 
-        # Encode list of example texts
-        emb = model.encode(texts, convert_to_tensor=True)  # shape: n x 768
 
-        # Mean pooling (centroid) gives stable category representation
-        mean_emb = emb.mean(dim=0)
+def _category_text(c):
+    return " | ".join([c["name"]] + c.get("examples", []))
 
-        cat_embeds.append(mean_emb)
-        cat_texts.append(" | ".join(texts))
 
-    return cat_texts, torch.stack(cat_embeds)
+def _taxonomy_fingerprint(taxonomy):
+    return hashlib.sha1(json.dumps(taxonomy, sort_keys=True).encode("utf-8")).hexdigest()
 
 
-_cat_texts, _cat_embeds = prepare_embeddings()
+class TaxonomyState:
+    """Everything queries read about the taxonomy, behind one reference.
+
+    A full rebuild builds a new state off to the side and swaps `_state`
+    (copy-on-write), so a query that grabbed `_state` never sees a half-built
+    mix. Incremental learn_examples() updates are O(d) per touched category
+    and applied in place.
+
+    `version` counts every change applied to the taxonomy (rebuilds and
+    learned examples); it is saved with taxonomy.json and write endpoints
+    return it.
+    """
+
+    def __init__(self, taxonomy, store, ann, generation, version=0):
+        self.taxonomy = taxonomy
+        self.store = store      # per-category example embeddings + running sums, see centroids.py
+        self.ann = ann          # per-example index for knn matching (None until needed), see ann.py
+        self.cat_texts = [_category_text(c) for c in taxonomy]
+        self.generation = generation
+        self.version = version
+
+    @property
+    def cat_embeds(self):
+        return self.store.centroids
+
+
+def prepare_ann_index(taxonomy, store):
+    """Per-example ANN index for MATCH_MODE=knn. Reuses the on-disk snapshot
+    when it was taken for this model and this exact taxonomy."""
+    fingerprint = _taxonomy_fingerprint(taxonomy)
+    if os.path.exists(ANN_SNAPSHOT):
+        try:
+            index = IVFIndex.load(ANN_SNAPSHOT, nprobe=ANN_NPROBE, min_train=ANN_MIN_TRAIN)
+            if index.meta == {"model": ENCODER_KEY, "fingerprint": fingerprint}:
+                return index
+        except Exception as e:
+            print("ANN snapshot unusable, rebuilding:", e)
+
+    vectors, labels = [], []
+    for idx, rows in enumerate(store.examples):
+        vectors.extend(rows)
+        labels.extend([idx] * len(rows))
+    vectors = F.normalize(torch.stack(vectors), dim=1).cpu().numpy()
+
+    index = IVFIndex(vectors.shape[1], nlist=ANN_NLIST, nprobe=ANN_NPROBE, min_train=ANN_MIN_TRAIN)
+    index.build(vectors, labels)
+    index.save(ANN_SNAPSHOT, model=ENCODER_KEY, fingerprint=fingerprint)
+    return index
+
+
+def _ensure_ann(state):
+    """Writer thread: build state's k-NN index if it doesn't have one yet."""
+    if state.ann is None:
+        state.ann = prepare_ann_index(state.taxonomy, state.store)
+    return state.ann
+
+
+def knn_index(state):
+    """state's k-NN index. Built on the writer thread the first time it is
+    needed, so no example learned meanwhile can slip past it."""
+    if state.ann is not None:
+        return state.ann
+    return _writer_pool.submit(_ensure_ann, state).result()
+
+
+def prepare_embeddings(taxonomy, generation=0, version=0):
+    # Full rebuild: re-encodes the name plus every example of every category.
+    # Mean pooling (centroid) gives stable category representation
+    store = CentroidStore(encode_examples)
+    store.rebuild(taxonomy)
+    # the k-NN index is only built up front when knn is the default mode,
+    # otherwise on the first knn query, see knn_index()
+    ann = prepare_ann_index(taxonomy, store) if MATCH_MODE == "knn" else None
+    return TaxonomyState(taxonomy, store, ann, generation, version)
+
+
+def rebuild_state(taxonomy=None):
+    """Writer thread: build a fresh state and swap it in. Queries keep using
+    the old one until the swap."""
+    global _state
+
+    started = time.monotonic()
+    taxonomy = copy.deepcopy(taxonomy if taxonomy is not None else _state.taxonomy)
+    state = prepare_embeddings(taxonomy, generation=_state.generation + 1, version=_state.version + 1)
+    save_taxonomy(state)
+    _state = state
+    _query_cache.clear_results()
+    _rebuild_status["last_duration"] = time.monotonic() - started
+
+
+def learn_examples(examples, categories=()):
+    """Add (category, example) pairs and new, possibly empty, categories.
+    Runs on the writer thread.
+
+    All new texts are encoded in one call before anything is changed, each
+    touched centroid row is refreshed once and the k-NN index gets one
+    insert. Unknown categories in `examples` are created. Returns the new
+    taxonomy version (unchanged if there was nothing new)."""
+    state = _state
+    taxonomy, store = state.taxonomy, state.store
+
+    index = {c["name"].lower(): i for i, c in enumerate(taxonomy)}
+    added = {}      # existing row idx -> new examples
+    created = {}    # lowercased name -> (name, examples) for new categories
+    for name in categories:
+        if name.lower() not in index:
+            created.setdefault(name.lower(), (name, []))
+    # examples a category already has are skipped, so a redelivered update
+    # (the Django outbox sends at least once) changes nothing
+    known = {}
+    for category, example in examples:
+        idx = index.get(category.lower())
+        key = category.lower() if idx is None else idx
+        if key not in known:
+            known[key] = set() if idx is None else set(taxonomy[idx].get("examples", []))
+        if example in known[key]:
+            continue
+        known[key].add(example)
+        if idx is not None:
+            added.setdefault(idx, []).append(example)
+        else:
+            created.setdefault(category.lower(), (category, []))[1].append(example)
+    if not added and not created:
+        return state.version
+
+    first_new = len(taxonomy)
+    # Taxonomy entries first, centroid rows after: a query scores against
+    # the centroid rows, so every index it gets back is already in taxonomy
+    for idx, rows in added.items():
+        taxonomy[idx].setdefault("examples", []).extend(rows)
+        state.cat_texts[idx] = _category_text(taxonomy[idx])
+    for offset, (name, rows) in enumerate(created.values()):
+        taxonomy.append({"id": str(first_new + offset + 1), "name": name, "examples": rows})
+        state.cat_texts.append(_category_text(taxonomy[-1]))
+    try:
+        store.extend(added, list(created.values()))
+    except Exception:
+        # the encode failed and left the store as it was: so is the taxonomy
+        del taxonomy[first_new:], state.cat_texts[first_new:]
+        for idx, rows in added.items():
+            del taxonomy[idx]["examples"][-len(rows):]
+            state.cat_texts[idx] = _category_text(taxonomy[idx])
+        raise
+
+    touched = list(added) + list(range(first_new, len(taxonomy)))
+    if state.ann is not None:
+        new_vectors, new_labels = [], []
+        for idx in touched:
+            rows = store.examples[idx][-len(added[idx]):] if idx in added else store.examples[idx]
+            new_vectors.extend(rows)
+            new_labels.extend([idx] * len(rows))
+        state.ann.add(F.normalize(torch.stack(new_vectors), dim=1).cpu().numpy(), new_labels)
+    # bumped before the cache is invalidated: lookup_queries relies on it
+    state.version += 1
+    _query_cache.invalidate_categories(touched, store.normed[touched])
+    return state.version
+
+
+def learn_example(category: str, example: str):
+    """Add one example to the taxonomy, see learn_examples()."""
+    return learn_examples([(category, example)])
+
+
+def save_taxonomy(state=None):
+    # write-then-rename, so a crash mid-write never leaves a truncated file
+    tmp = TAX_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        state = state or _state
+        json.dump({"version": state.version, "categories": state.taxonomy}, fh, indent=2)
+    os.replace(tmp, TAX_PATH)
+
+
+_state = prepare_embeddings(_initial_taxonomy, version=_initial_version)
+_rebuild_status = {"running": False, "queued": 0, "last_duration": None, "last_error": None}
+
+_inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="taxonomy-writer")
+_admission = AdmissionControl(INFERENCE_MAX_PENDING, RETRY_AFTER_SECONDS)
+
+
+async def run_inference(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_inference_pool, partial(fn, *args, **kwargs))
+
+
+async def run_writer(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_writer_pool, partial(fn, *args, **kwargs))
+
+
+def schedule_rebuild(taxonomy=None):
+    """Queue a rebuild on the writer thread without waiting for it."""
+    def job():
+        _rebuild_status.update(running=True, queued=_rebuild_status["queued"] - 1)
+        try:
+            rebuild_state(taxonomy)
+            _rebuild_status["last_error"] = None
+        except Exception as e:
+            print("taxonomy rebuild failed:", e)
+            _rebuild_status["last_error"] = str(e)
+        finally:
+            _rebuild_status["running"] = False
+
+    _rebuild_status["queued"] += 1
+    _writer_pool.submit(job)
+
+
+# ---------- Query Lookup ----------
+
+def _entities(doc):
+    return [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+
+
+def extract_entities(texts):
+    """NER for many texts, streamed through nlp.pipe."""
+    docs = nlp.pipe(texts, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS)
+    return [_entities(doc) for doc in docs]
+
+
+def score_embeddings(state, qembeds):
+    """Top-k categories for a batch of query embeddings: one matmul against the
+    pre-normalized centroids, one topk, one copy back to the host."""
+    cats = state.store.normed
+    sims = F.normalize(qembeds, dim=1) @ cats.T
+    raws, idxs = sims.topk(min(TOP_K_DEPTH, cats.shape[0]), dim=1)
+    return list(zip(idxs.tolist(), raws.tolist()))
+
+
+def check_mode(mode):
+    mode = mode or MATCH_MODE
+    if mode not in ("centroid", "knn"):
+        raise HTTPException(status_code=400, detail=f"unknown mode {mode!r}")
+    return mode
+
+
+def lookup_queries(state, texts, with_entities=True, mode=None):
+    """Return (entities, (top_idxs, top_raws)) per text, best category first.
+
+    Texts are normalized first (see normalize.py), so descriptions that only
+    differ in amounts/refs/UPI ids share one cache entry and one encode. The
+    encoder runs once per distinct normalized string and the result is fanned
+    back out to every text that maps to it. With `with_entities=False` spaCy
+    is skipped and entities come back empty.
+
+    `mode` is "centroid" or "knn" (default MATCH_MODE). k-NN results depend on
+    every example, so only the embedding and entities are cached for them.
+    """
+    mode = check_mode(mode)
+
+    keys = [normalize(t) for t in texts]
+    entries = [_query_cache.get(k) for k in keys]
+
+    missing = {}
+    for k, e in zip(keys, entries):
+        if e is None and k not in missing:
+            missing[k] = None
+    if missing:
+        qembeds = model.encode(list(missing), convert_to_tensor=True)
+        for k, qembed in zip(list(missing), qembeds):
+            entry = {"embedding": qembed, "ner": None, "result": None}
+            _query_cache.put(k, entry)
+            missing[k] = entry
+        entries = [e if e is not None else missing[k] for k, e in zip(keys, entries)]
+
+    # Entities depend on the literal amounts/merchants, so they are only
+    # reused for the exact description they were extracted from
+    entities = {}
+    if with_entities:
+        pending = {}
+        for t, e in zip(texts, entries):
+            ner = e["ner"]
+            if ner is not None and ner[0] == t:
+                entities[t] = ner[1]
+            elif t not in entities:
+                pending.setdefault(t, e)
+        for (t, e), ents in zip(pending.items(), extract_entities(list(pending))):
+            entities[t] = ents
+            e["ner"] = (t, ents)
+
+    if mode == "knn":
+        qembeds = F.normalize(torch.stack([e["embedding"] for e in entries]), dim=1).cpu().numpy()
+        results = knn_index(state).vote(qembeds, KNN_K, len(state.taxonomy), TOP_K_DEPTH)
+        return [(entities.get(t, []), r) for t, r in zip(texts, results)]
+
+    # Read each classification once: a concurrent taxonomy update may reset it.
+    # Results are tagged with the state generation they were scored against;
+    # a list shorter than the current depth predates a new category.
+    depth = min(TOP_K_DEPTH, len(state.taxonomy))
+    results = [e["result"] for e in entries]
+    results = [
+        r[1:] if r is not None and r[0] == state.generation and len(r[1]) == depth else None
+        for r in results
+    ]
+
+    # Score everything without a (still valid) classification in one pass
+    unscored = list({id(e): e for e, r in zip(entries, results) if r is None}.values())
+    if unscored:
+        fresh = {}
+        version = state.version
+        scored = score_embeddings(state, torch.stack([e["embedding"] for e in unscored]))
+        for e, r in zip(unscored, scored):
+            fresh[id(e)] = (state.generation,) + r
+            e["result"] = fresh[id(e)]
+        # An update applied meanwhile may have scored against centroids it
+        # then moved, and invalidated these entries before they were stored.
+        # It bumps the version before invalidating, so it either saw the
+        # stored results or is caught here.
+        if state.version != version:
+            for e in unscored:
+                if e["result"] is fresh[id(e)]:
+                    e["result"] = None
+        results = [r if r is not None else fresh[id(e)][1:] for e, r in zip(entries, results)]
+
+    return [(entities.get(t, []), r) for t, r in zip(texts, results)]
+
+
+def build_results(state, texts, lookups, top_k=0):
+    """Turn lookup_queries() output into response dicts plus a low-confidence
+    mask, computed for the whole batch at once. A text without any candidate
+    (k-NN over an empty index) gets category None and is low confidence."""
+    # k-NN can return fewer candidates than depth: pad with index -1
+    width = max(1, max(len(r[0]) for _, r in lookups))
+    top_idxs = torch.tensor([r[0] + [-1] * (width - len(r[0])) for _, r in lookups])
+    raws = torch.tensor([r[1] + [-1.0] * (width - len(r[1])) for _, r in lookups])
+    scores = (raws + 1) / 2  # (-1 → 1) → (0 → 1)
+    margins = scores[:, :1] - scores
+    low = (scores[:, 0] < LOW_SCORE_THRESHOLD).tolist()
+
+    top_idxs, scores, margins = top_idxs.tolist(), scores.tolist(), margins.tolist()
+    taxonomy = state.taxonomy
+    results = []
+    for i, (text, (entities, _)) in enumerate(zip(texts, lookups)):
+        result = {
+            "text": text,
+            "category": taxonomy[top_idxs[i][0]] if top_idxs[i][0] >= 0 else None,
+            "score": scores[i][0],
+            "entities": entities
+        }
+        if top_k > 0:
+            result["top_k"] = [
+                {"id": taxonomy[c]["id"], "name": taxonomy[c]["name"], "score": sc, "margin": m}
+                for c, sc, m in zip(top_idxs[i][:top_k], scores[i][:top_k], margins[i][:top_k])
+                if c >= 0
+            ]
+        results.append(result)
+    return results, low
+
+
+def classify_texts(texts, with_entities=True, mode=None, top_k=0):
+    """lookup_queries() + build_results() against one consistent state."""
+    state = _state
+    lookups = lookup_queries(state, texts, with_entities=with_entities, mode=mode)
+    return build_results(state, texts, lookups, top_k=top_k)
+
+
+def match_batch(items):
+    """Micro-batch worker for /match: items are (text, with_entities, mode,
+    top_k), grouped so each option combination is one classify_texts() call."""
+    groups = {}
+    for i, (text, *options) in enumerate(items):
+        groups.setdefault(tuple(options), []).append(i)
+
+    out = [None] * len(items)
+    for (with_entities, mode, top_k), idxs in groups.items():
+        results, _ = classify_texts([items[i][0] for i in idxs], with_entities=with_entities, mode=mode, top_k=top_k)
+        for i, result in zip(idxs, results):
+            out[i] = result
+    return out
+
+
+_match_batcher = MicroBatcher(
+    match_batch,
+    max_batch=MATCH_BATCH_SIZE,
+    max_wait_ms=MATCH_BATCH_WAIT_MS,
+    executor=_inference_pool,
+)
 
 
 # ---------- API Routes ----------
 
 @app.get("/taxonomy")
-def get_taxonomy():
-    return taxonomy
+async def get_taxonomy():
+    return _state.taxonomy
 
 
-@app.post("/taxonomy/update")
-def update_taxonomy(payload: Dict[str, Any]):
-    global taxonomy, _cat_texts, _cat_embeds
+def _learn_and_save(category, example):
+    version = learn_example(category, example)
+    save_taxonomy()
+    return version, len(_state.taxonomy)
 
+
+@app.post("/taxonomy/update")
+async def update_taxonomy(payload: Dict[str, Any]):
     if isinstance(payload, list):
-        taxonomy = payload
-    else:
-        category = payload.get("category")
-        example = payload.get("example")
+        # Whole taxonomy replaced: nothing to reuse, rebuild in the background
+        schedule_rebuild(payload)
+        return {"status": "rebuilding", "count": len(payload)}
 
-        if not category or not example:
-            raise HTTPException(status_code=400, detail="Invalid payload")
+    category = payload.get("category")
+    example = payload.get("example")
 
-        found = next((c for c in taxonomy if c["name"].lower() == category.lower()), None)
-        if found:
-            found.setdefault("examples", []).append(example)
-        else:
-            taxonomy.append({
-                "id": str(len(taxonomy) + 1),
-                "name": category,
-                "examples": [example]
-            })
+    if not category or not example:
+        raise HTTPException(status_code=400, detail="Invalid payload")
 
-    with open(TAX_PATH, "w", encoding="utf-8") as fh:
-        json.dump(taxonomy, fh, indent=2)
+    version, count = await run_writer(_learn_and_save, category, example)
+    return {"status": "ok", "count": count, "version": version}
 
-    _cat_texts, _cat_embeds = prepare_embeddings()
-    return {"status": "ok", "count": len(taxonomy)}
 
+class TaxonomyExample(BaseModel):
+    category: str
+    example: str
 
-@app.post("/match")
-def match_text(payload: Dict[str, str]):
-    text = payload.get("text", "").strip()
-    if not text:
-        raise HTTPException(status_code=400, detail="text required")
+class BulkTaxonomyUpdate(BaseModel):
+    examples: List[TaxonomyExample] = []
+    categories: List[str] = []  # new categories, examples optional
 
-    # NER
-    doc = nlp(text)
-    entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
 
-    # Encode query
-    qembed = model.encode(text, convert_to_tensor=True)
+def _learn_many_and_save(examples, categories):
+    version = learn_examples(examples, categories)
+    save_taxonomy()
+    return version, len(_state.taxonomy)
 
-    # Cosine similarity
-    sims = util.cos_sim(qembed, _cat_embeds)[0]
-    best_idx = int(sims.argmax().cpu().numpy())
-    raw_score = float(sims[best_idx])
 
-    # Normalize score (-1 → 1) → (0 → 1)
-    norm_score = (raw_score + 1) / 2
+@app.post("/taxonomy/update/bulk")
+async def update_taxonomy_bulk(payload: BulkTaxonomyUpdate):
+    """Many examples and new categories in one write: one encode, each touched
+    centroid refreshed once, taxonomy.json written once."""
+    examples = [(e.category.strip(), e.example.strip()) for e in payload.examples]
+    categories = [c.strip() for c in payload.categories]
+    if not examples and not categories:
+        raise HTTPException(status_code=400, detail="examples or categories required")
+    if not all(c and e for c, e in examples) or not all(categories):
+        raise HTTPException(status_code=400, detail="Invalid payload")
 
-    return {
-        "category": taxonomy[best_idx],
-        "score": norm_score,
-        "entities": entities
+    version, count = await run_writer(_learn_many_and_save, examples, categories)
+    return {"status": "ok", "count": count, "version": version, "examples": len(examples)}
+
+
+@app.post("/taxonomy/rebuild")
+async def rebuild_taxonomy():
+    """Admin: re-encode every category from scratch, in the background.
+    The current state keeps serving until the new one is swapped in."""
+    if _rebuild_status["queued"]:
+        return {"status": "already_queued", "generation": _state.generation}
+    schedule_rebuild()
+    return {"status": "rebuilding", "generation": _state.generation}
+
+
+class MatchRequest(BaseModel):
+    text: str
+    entities: bool = True   # False skips spaCy NER entirely
+    # >0 adds runner-up categories and margins; only TOP_K_DEPTH are ranked
+    top_k: int = Field(0, ge=0, le=TOP_K_DEPTH)
+    mode: Optional[str] = None  # "centroid" | "knn", default MATCH_MODE
+
+
+@app.post("/match")
+async def match_text(payload: MatchRequest):
+    text = payload.text.strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="text required")
+    mode = check_mode(payload.mode)
+
+    async with _admission.admit():
+        # Concurrent /match calls are encoded together, see batcher.py
+        result = await _match_batcher.submit((text, payload.entities, mode, payload.top_k))
+
+    response = {
+        "category": result["category"],
+        "score": result["score"],
+        "entities": result["entities"]
     }
+    if "top_k" in result:
+        response["top_k"] = result["top_k"]
+    return response
 
 
 # ---------- Bulk API ----------
 
 class BulkClassifyRequest(BaseModel):
     items: List[str]
+    entities: bool = True   # False skips spaCy NER entirely
+    top_k: int = Field(0, ge=0, le=TOP_K_DEPTH)  # as in MatchRequest
+    mode: Optional[str] = None  # "centroid" | "knn", default MATCH_MODE
 
 class BulkClassifyResponseItem(BaseModel):
     text: str
-    category: Dict[str, Any]
+    category: Optional[Dict[str, Any]]   # None when nothing matched
     score: float
     entities: List[Dict[str, str]] = []
+    top_k: Optional[List[Dict[str, Any]]] = None
 
 class FeedbackItem(BaseModel):
     text: str
@@ -159,73 +624,71 @@ class FeedbackRequest(BaseModel):
 
 
 @app.post("/classify/bulk")
-def classify_bulk(payload: BulkClassifyRequest):
+async def classify_bulk(payload: BulkClassifyRequest):
     texts = payload.items
     if not texts:
         raise HTTPException(status_code=400, detail="Items required")
+    mode = check_mode(payload.mode)
 
-    qembeds = model.encode(texts, convert_to_tensor=True)
-    sims = util.cos_sim(qembeds, _cat_embeds)
-
-    high_confidence = []
-    low_confidence = []
+    async with _admission.admit():
+        results, low = await run_inference(
+            classify_texts, texts, with_entities=payload.entities, mode=mode, top_k=payload.top_k
+        )
 
-    for i, text in enumerate(texts):
-        row = sims[i]
-        best_idx = int(row.argmax().cpu().numpy())
-        raw_score = float(row[best_idx])
-        norm_score = (raw_score + 1) / 2
+    high_confidence = [r for r, is_low in zip(results, low) if not is_low]
+    low_confidence = [r for r, is_low in zip(results, low) if is_low]
 
-        doc = nlp(text)
-        entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
-
-        result = {
-            "text": text,
-            "category": taxonomy[best_idx],
-            "score": norm_score,
-            "entities": entities
-        }
-        
-        if norm_score < LOW_SCORE_THRESHOLD:
-            low_confidence.append(result)
-        else:
-            high_confidence.append(result)
-            
-    print(high_confidence)
-    
     return {
         "high_confidence": high_confidence,
         "low_confidence": low_confidence   # UI uses this list for review
     }
 
-@app.post("/feedback")
-def receive_feedback(payload: FeedbackRequest):
-    global taxonomy, _cat_texts, _cat_embeds
 
-    from db import update_transaction_category  # you will create this
+def _snapshot_ann():
+    state = _state
+    _ensure_ann(state).save(ANN_SNAPSHOT, model=ENCODER_KEY, fingerprint=_taxonomy_fingerprint(state.taxonomy))
+    return len(state.ann)
 
-    for item in payload.feedback:
-        text = item.text
-        correct_cat = item.correct_category
 
-        # Update PostgreSQL
-        update_transaction_category(text, correct_cat)
+@app.post("/ann/snapshot")
+async def snapshot_ann():
+    """Persist the k-NN index, including incremental inserts, to disk."""
+    vectors = await run_writer(_snapshot_ann)
+    return {"status": "saved", "vectors": vectors, "path": ANN_SNAPSHOT}
 
-        # Update taxonomy (learning)
-        found = next((c for c in taxonomy if c["name"].lower() == correct_cat.lower()), None)
-        if found:
-            found.setdefault("examples", []).append(text)
-        else:
-            taxonomy.append({
-                "id": str(len(taxonomy) + 1),
-                "name": correct_cat,
-                "examples": [text]
-            })
 
-    # Save taxonomy & rebuild embeddings
-    with open(TAX_PATH, "w", encoding="utf-8") as fh:
-        json.dump(taxonomy, fh, indent=2)
+@app.get("/metrics")
+async def metrics():
+    ann = _state.ann
+    return {
+        "query_cache": _query_cache.stats(),
+        "match_batcher": _match_batcher.stats(),
+        "ann": {
+            "built": ann is not None,
+            "vectors": len(ann) if ann is not None else 0,
+            "lists": len(ann.lists) if ann is not None else 0,
+            "mode": MATCH_MODE,
+        },
+        "encoder": {"model": MODEL_NAME, "backend": ENCODER_BACKEND},
+        "inference": dict(_admission.stats(), workers=INFERENCE_WORKERS),
+        "rebuild": dict(_rebuild_status, generation=_state.generation),
+        "version": _state.version,
+    }
 
-    _cat_texts, _cat_embeds = prepare_embeddings()
 
-    return {"status": "updated", "updated_count": len(payload.feedback)}
\ No newline at end of file
+def _apply_feedback(feedback):
+    from db import update_transaction_category  # you will create this
+
+    for item in feedback:
+        # Update PostgreSQL
+        update_transaction_category(item.text, item.correct_category)
+
+    # Update taxonomy (learning), only the touched centroids are refreshed
+    learn_examples([(item.correct_category, item.text) for item in feedback])
+    save_taxonomy()
+
+
+@app.post("/feedback")
+async def receive_feedback(payload: FeedbackRequest):
+    await run_writer(_apply_feedback, payload.feedback)
+    return {"status": "updated", "updated_count": len(payload.feedback)}
@@ -0,0 +1,35 @@
+import re
+
+# Bank/UPI descriptions mostly differ only in volatile tokens, e.g.
+#   "Paid Rs 159.07 to 310545@okaxis. UTR 804257186133."
+#   "paid rs <amt> to <upi> utr <ref>"
+# Masking them lets identical templates share one embedding.
+
+_MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+
+# Order matters: UPI ids, amounts and refs contain digits the later patterns
+# would otherwise eat
+_PATTERNS = [
+    # personal UPI ids only (phone/account numbers, x-masked or not);
+    # merchant handles like swiggy@icici say who was paid and stay
+    (re.compile(r"(?<![\w.\-])(?=[\dx.\-]*(?:\d|xx))[\dx.\-]+@[a-z][a-z0-9]*"), " <upi> "),
+    (re.compile(r"(?:\brs\.?|\binr|₹)\s*\d[\d,]*(?:\.\d+)?"), " rs <amt> "),
+    (re.compile(r"(?:ref#)?\d{6,}"), " <ref> "),
+    (re.compile(r"\d[\d,]*\.\d+"), " <amt> "),
+    (re.compile(r"\b\d{4}-\d{1,2}-\d{1,2}\b"), " <date> "),
+    (re.compile(r"\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b"), " <date> "),
+    (re.compile(r"\b\d{1,2}[-/ ]" + _MONTHS + r"(?:[-/ ]\d{2,4})?\b"), " <date> "),
+    (re.compile(r"\bx{2,}\d+\b"), " <acct> "),
+    (re.compile(r"\d{4,}"), " <num> "),
+]
+_TRAILING_PUNCT = re.compile(r"[.,;]+(?=\s|$)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Lowercase, mask volatile tokens into placeholders, collapse whitespace."""
+    text = text.lower()
+    for pattern, repl in _PATTERNS:
+        text = pattern.sub(repl, text)
+    text = _TRAILING_PUNCT.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
@@ -0,0 +1,85 @@
+"""Compare encoder backends against fp32 on real transaction descriptions.
+
+    python parity.py ../../../../../data/transactions.csv --backends int8,onnx
+
+For each backend reports the cosine between its embedding and the fp32
+embedding of the same (normalized) description, how often the top-1
+centroid category agrees with fp32, and encode throughput. Pick
+ENCODER_BACKEND from these numbers.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from encoders import load_encoder
+from normalize import normalize
+
+
+def read_descriptions(path, limit):
+    with open(path, newline="", encoding="utf-8") as fh:
+        texts = [row["description"] for row in csv.DictReader(fh) if row.get("description")]
+    return texts[:limit] if limit else texts
+
+
+def unit(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def encode(model, texts, batch_size):
+    start = time.perf_counter()
+    vecs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    return unit(vecs.astype(np.float32)), time.perf_counter() - start
+
+
+def centroids(model, taxonomy, batch_size):
+    rows = []
+    for c in taxonomy:
+        vecs, _ = encode(model, [normalize(t) for t in [c["name"]] + c.get("examples", [])], batch_size)
+        rows.append(vecs.mean(axis=0))
+    return unit(np.stack(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv", help="transactions csv with a description column")
+    parser.add_argument("--backends", default="int8,onnx")
+    parser.add_argument("--model", default=os.getenv("SENTE_MODEL", "all-mpnet-base-v2"))
+    parser.add_argument("--taxonomy", default=os.path.join(os.path.dirname(__file__), "taxonomy.json"))
+    parser.add_argument("--limit", type=int, default=0, help="only use the first N rows")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    texts = [normalize(t) for t in read_descriptions(args.csv, args.limit)]
+    with open(args.taxonomy, "r", encoding="utf-8") as fh:
+        taxonomy = json.load(fh)
+    if isinstance(taxonomy, dict):
+        taxonomy = taxonomy["categories"]
+    print(f"{len(texts)} descriptions, {len(taxonomy)} categories, model {args.model}")
+
+    base_model = load_encoder(args.model, "torch")
+    base, base_secs = encode(base_model, texts, args.batch_size)
+    base_top1 = (base @ centroids(base_model, taxonomy, args.batch_size).T).argmax(axis=1)
+    print(f"{'torch':6s}  {len(texts) / base_secs:8.1f} texts/s  (reference)")
+
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        try:
+            model = load_encoder(args.model, backend)
+        except Exception as e:
+            print(f"{backend:6s}  skipped: {e}")
+            continue
+        vecs, secs = encode(model, texts, args.batch_size)
+        cos = (vecs * base).sum(axis=1)
+        top1 = (vecs @ centroids(model, taxonomy, args.batch_size).T).argmax(axis=1)
+        print(
+            f"{backend:6s}  {len(texts) / secs:8.1f} texts/s  x{base_secs / secs:.2f}"
+            f"  cos mean {cos.mean():.5f} p01 {np.percentile(cos, 1):.5f} min {cos.min():.5f}"
+            f"  top-1 agreement {(top1 == base_top1).mean():.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
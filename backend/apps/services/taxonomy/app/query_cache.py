@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+import torch.nn.functional as F
+
+
+class QueryCache:
+    """Bounded LRU + TTL cache of query embeddings and classifications.
+
+    Each entry is a dict:
+      embedding  query embedding (1-d tensor), depends only on the model
+      ner        (original description, its spaCy entities)
+      result     (taxonomy generation, top-k category indices, their raw
+                 cosine scores), best first, or None when the classification
+                 needs recomputing
+
+    On a hit the caller skips both the encoder and spaCy. Taxonomy changes
+    only drop the cached classification, the embedding is kept so rescoring
+    is a single matmul.
+
+    A unit-length copy of every cached embedding also sits in one row of
+    `_embeds`, grown by doubling up to maxsize and reused as entries leave,
+    so a taxonomy update checks the whole cache with one matmul instead of
+    stacking every embedding first.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, row, entry)
+        self._lock = threading.Lock()
+        self._embeds = None          # rows x d, normalized embeddings
+        self._rows = []              # row -> entry, None when free
+        self._free = []              # rows to reuse
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, row, entry = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._release(row)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            old = self._data.get(key)
+            row = old[1] if old is not None else self._claim(entry["embedding"])
+            self._embeds[row] = F.normalize(entry["embedding"], dim=0)
+            self._rows[row] = entry
+            self._data[key] = (time.monotonic() + self.ttl, row, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _, (_, row, _) = self._data.popitem(last=False)
+                self._release(row)
+                self.evictions += 1
+
+    def _claim(self, embedding):
+        """A free row of `_embeds` (lock held), growing it when full."""
+        if self._free:
+            return self._free.pop()
+        row = len(self._rows)
+        if self._embeds is None or row == self._embeds.shape[0]:
+            size = min(max(2 * row, 1024), self.maxsize + 1)
+            grown = embedding.new_empty((size, embedding.shape[0]))
+            if self._embeds is not None:
+                grown[:row] = self._embeds
+            self._embeds = grown
+        self._rows.append(None)
+        return row
+
+    def _release(self, row):
+        self._rows[row] = None
+        self._free.append(row)
+
+    def invalidate_categories(self, idxs, centroids):
+        """Centroids `idxs` (rows of `centroids`, k x d) moved or were added:
+        drop top-k lists that contain one of them, and those one would now
+        enter. One matmul over the cached embeddings for all of them."""
+        if not len(idxs):
+            return
+        with self._lock:
+            if not self._rows:
+                return
+            # under the lock: a row freed and reused meanwhile would be
+            # checked against the wrong entry
+            rows = self._embeds[:len(self._rows)]
+            best = (rows @ F.normalize(centroids, dim=1).to(rows.device).T).max(dim=1).values
+            entries = list(self._rows)
+
+        touched = set(idxs)
+        for e, s in zip(entries, best.tolist()):
+            result = e["result"] if e is not None else None
+            if result is None:
+                continue
+            _, top, raws = result
+            if s > raws[-1] or not touched.isdisjoint(top):
+                e["result"] = None
+
+    def clear_results(self):
+        """Whole taxonomy changed: keep embeddings, drop every classification."""
+        with self._lock:
+            for _, _, e in self._data.values():
+                e["result"] = None
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from ann import IVFIndex  # noqa: E402
+
+
+def unit(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def test_vote_prefers_exact_match_in_small_category():
+    rng = np.random.default_rng(0)
+    query = unit(rng.normal(size=16))
+    # label 0: many examples fairly close to the query; label 1: one exact copy
+    near = unit(query + 0.6 * rng.normal(size=(9, 16)))
+    index = IVFIndex(16)
+    index.build(np.vstack([near, query]), [0] * 9 + [1])
+
+    labels, scores = index.vote(query[None], k=10, n_labels=2, depth=2)[0]
+
+    assert labels == [1, 0]
+    assert scores[0] >= 0.999
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_vote_ranks_by_reported_score():
+    rng = np.random.default_rng(1)
+    vectors = unit(rng.normal(size=(200, 16)))
+    index = IVFIndex(16)
+    index.build(vectors, rng.integers(0, 8, 200))
+
+    for labels, scores in index.vote(unit(rng.normal(size=(20, 16))), k=10, n_labels=8, depth=5):
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_vote_on_empty_index_has_no_candidates():
+    index = IVFIndex(4)
+    assert index.vote(unit(np.ones((1, 4))), k=5, n_labels=3, depth=3) == [([], [])]
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from query_cache import QueryCache  # noqa: E402
+
+
+def cached(cache, cats, key):
+    embedding = torch.randn(cats.shape[1])
+    raws, idxs = (F.normalize(embedding, dim=0) @ cats.T).topk(3)
+    entry = {"embedding": embedding, "ner": None, "result": (0, idxs.tolist(), raws.tolist())}
+    cache.put(key, entry)
+    return entry
+
+
+def test_invalidate_drops_only_affected_results():
+    torch.manual_seed(0)
+    cats = F.normalize(torch.randn(10, 32), dim=1)
+    cache = QueryCache(maxsize=200)
+    entries = [cached(cache, cats, n) for n in range(300)]
+    live = entries[-200:]
+
+    cats[4] = F.normalize(live[0]["embedding"], dim=0)
+    expected = [
+        float(F.normalize(e["embedding"], dim=0) @ cats[4]) > e["result"][2][-1] or 4 in e["result"][1]
+        for e in live
+    ]
+    cache.invalidate_categories([4], cats[[4]])
+
+    assert [e["result"] is None for e in live] == expected
+    assert live[0]["result"] is None and not all(expected)
+
+
+def test_rows_are_reused_after_eviction():
+    cats = F.normalize(torch.randn(5, 8), dim=1)
+    cache = QueryCache(maxsize=4)
+    for n in range(20):
+        cached(cache, cats, n)
+
+    assert len(cache) == 4
+    assert len(cache._rows) == 5
+    for _, row, entry in cache._data.values():
+        assert cache._rows[row] is entry
+        assert torch.allclose(cache._embeds[row], F.normalize(entry["embedding"], dim=0))
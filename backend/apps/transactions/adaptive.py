@@ -0,0 +1,54 @@
+class AIMDController:
+    """Additive-increase / multiplicative-decrease sizing toward a target latency.
+
+    After each call of `size` items that took `seconds`, the size grows by
+    `step` if the call came in under `target` seconds and is cut by
+    `decrease` if it didn't (or failed), always within [minimum, maximum].
+    It also keeps an EWMA of seconds per item, for deriving timeouts.
+    """
+
+    def __init__(self, initial, minimum, maximum, target, step=None, decrease=0.5, alpha=0.2):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.step = step or max(1, minimum // 2)
+        self.decrease = decrease
+        self.alpha = alpha
+        self.value = self._clamp(initial)
+        self.per_item = None
+
+    def _clamp(self, size):
+        return int(min(self.maximum, max(self.minimum, size)))
+
+    def observe(self, size, seconds):
+        if size:
+            per_item = seconds / size
+            self.per_item = per_item if self.per_item is None else (
+                self.alpha * per_item + (1 - self.alpha) * self.per_item
+            )
+        if seconds <= self.target:
+            self.value = self._clamp(self.value + self.step)
+        else:
+            self.value = self._clamp(self.value * self.decrease)
+
+    def backoff(self):
+        """A failed call: decrease without a latency sample."""
+        self.value = self._clamp(self.value * self.decrease)
+
+    def timeout(self, factor, minimum, maximum):
+        """`factor` times the expected duration of a call at the current size."""
+        if self.per_item is None:
+            return maximum
+        return min(maximum, max(minimum, factor * self.per_item * self.value))
+
+    def state(self):
+        return {'size': self.value, 'per_item': self.per_item}
+
+    @classmethod
+    def resume(cls, state, *args, **kwargs):
+        """Rebuild a controller from state(), e.g. carried into a retry."""
+        ctl = cls(*args, **kwargs)
+        if state:
+            ctl.value = ctl._clamp(state['size'])
+            ctl.per_item = state['per_item']
+        return ctl
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Transaction, CategoryData
+from .models import Transaction, CategoryData, TaxonomyOutbox
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
@@ -10,3 +10,9 @@ class TransactionAdmin(admin.ModelAdmin):
 class CategoryDataAdmin(admin.ModelAdmin):
     list_display = ('category_name', 'example_text', 'created_at')
     search_fields = ('category_name', 'example_text')
+
+@admin.register(TaxonomyOutbox)
+class TaxonomyOutboxAdmin(admin.ModelAdmin):
+    list_display = ('category_name', 'example_text', 'created_at', 'sent_at', 'version', 'attempts')
+    list_filter = ('sent_at',)
+    search_fields = ('category_name', 'example_text')
@@ -0,0 +1,89 @@
+import io
+import json
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import JSONField
+
+
+def bulk_insert(model, objs, ignore_conflicts=False):
+    """Insert unsaved `objs` of `model` in one go and return how many were sent.
+
+    On PostgreSQL (with DB_BULK_COPY on) this streams the rows through
+    COPY FROM STDIN on Django's own connection; elsewhere it is plain
+    bulk_create. Like bulk_create(ignore_conflicts=True) it doesn't set
+    primary keys on `objs`.
+    """
+    if not objs:
+        return 0
+    if connection.vendor != 'postgresql' or not settings.DB_BULK_COPY:
+        model.objects.bulk_create(objs, ignore_conflicts=ignore_conflicts)
+        return len(objs)
+    return copy_insert(model, objs, ignore_conflicts=ignore_conflicts)
+
+
+def copy_insert(model, objs, ignore_conflicts=False):
+    """COPY `objs` into `model`'s table (text format).
+
+    COPY can't skip conflicting rows, so with ignore_conflicts the rows go
+    into a temporary table first and are moved over with
+    INSERT ... ON CONFLICT DO NOTHING. The temporary table has only the
+    copied columns: `id` is an identity column, which LIKE would copy as a
+    plain NOT NULL column without its default.
+    """
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    table = connection.ops.quote_name(model._meta.db_table)
+
+    data = io.StringIO()
+    for obj in objs:
+        data.write('\t'.join(_copy_value(f, obj) for f in fields))
+        data.write('\n')
+    data.seek(0)
+
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        target = table
+        if ignore_conflicts:
+            target = connection.ops.quote_name(f"_copy_{model._meta.db_table}")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {target} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA"
+            )
+        _copy_from(cursor.cursor, f"COPY {target} ({columns}) FROM STDIN", data)
+        if ignore_conflicts:
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {target} ON CONFLICT DO NOTHING"
+            )
+            cursor.execute(f"DROP TABLE {target}")
+    return len(objs)
+
+
+def _copy_from(raw_cursor, sql, data):
+    if hasattr(raw_cursor, 'copy_expert'):
+        # psycopg2
+        raw_cursor.copy_expert(sql, data)
+    else:
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            while chunk := data.read(1 << 16):
+                copy.write(chunk)
+
+
+def _copy_value(field, obj):
+    value = field.pre_save(obj, add=True)   # fills auto_now_add and friends
+    if value is None:
+        return '\\N'
+    if isinstance(field, JSONField):
+        value = json.dumps(value, cls=field.encoder)
+    else:
+        value = field.get_db_prep_save(value, connection)
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            value = 't' if value else 'f'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
@@ -0,0 +1,54 @@
+import time
+
+import redis
+
+
+class CircuitBreaker:
+    """Circuit breaker shared by every Celery worker through Redis.
+
+    After `threshold` consecutive failures the circuit opens for
+    `reset_timeout` seconds and callers should back off instead of calling.
+    After that one caller at a time is let through as a probe (half-open): a
+    success closes the circuit, a failure opens it again. If Redis itself is
+    unreachable the breaker stays closed rather than blocking all work.
+    """
+
+    def __init__(self, name, url, threshold=5, reset_timeout=30):
+        self.key = f"circuit:{name}"
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.redis = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=1)
+
+    def retry_in(self):
+        """Seconds until the circuit stops refusing calls (0 if it isn't)."""
+        try:
+            open_until = self.redis.get(f"{self.key}:open_until")
+        except redis.RedisError:
+            return 0.0
+        return max(0.0, float(open_until) - time.time()) if open_until else 0.0
+
+    def allow(self):
+        try:
+            open_until = self.redis.get(f"{self.key}:open_until")
+            if open_until is None:
+                return True
+            if float(open_until) > time.time():
+                return False
+            # half-open: a single probe per reset_timeout
+            return bool(self.redis.set(f"{self.key}:probe", 1, nx=True, ex=max(1, int(self.reset_timeout))))
+        except redis.RedisError:
+            return True
+
+    def record_success(self):
+        try:
+            self.redis.delete(f"{self.key}:failures", f"{self.key}:open_until", f"{self.key}:probe")
+        except redis.RedisError:
+            pass
+
+    def record_failure(self):
+        try:
+            if self.redis.incr(f"{self.key}:failures") >= self.threshold:
+                self.redis.set(f"{self.key}:open_until", time.time() + self.reset_timeout)
+                self.redis.delete(f"{self.key}:probe")
+        except redis.RedisError:
+            pass
@@ -0,0 +1,247 @@
+import codecs
+import csv
+import json
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.utils import timezone
+
+from .bulk import bulk_insert
+from .models import UploadBatch, UploadItem
+from .progress import publish_progress
+from .tasks import process_upload_batch
+
+
+class _Starved(Exception):
+    pass
+
+
+class _LineFeed:
+    """Lines for a long-lived csv.reader, appended as they arrive.
+
+    csv.reader pulls its lines, but ours are pushed in. When it runs out in
+    the middle of a record (a quoted field spanning lines that haven't
+    arrived yet), the lines it took for that record are put back and read
+    again once more data is in."""
+
+    def __init__(self):
+        self.lines = deque()
+        self.taken = []
+        self.eof = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            if self.eof:
+                raise StopIteration
+            raise _Starved()
+        line = self.lines.popleft()
+        self.taken.append(line)
+        return line
+
+    def rewind(self):
+        self.lines.extendleft(reversed(self.taken))
+        self.taken = []
+
+
+class UploadIngest:
+    """Turns an upload into an UploadBatch incrementally.
+
+    Bytes are fed in as they arrive and parsed as CSV (.csv) or NDJSON
+    (.ndjson / .jsonl). Rows are inserted UPLOAD_INGEST_CHUNK at a time, each
+    insert committed on its own. The batch task is started right after the
+    first insert and keeps picking up new rows until finish() clears
+    `ingesting`. A plain .json array can't be parsed before it's complete,
+    so it is buffered and parsed at finish().
+
+    Any error while ingesting aborts the batch (FAILED, `ingesting`
+    cleared). The batch's updated_at is kept fresh while bytes arrive, so
+    the batch task can tell an ingest that died with its process from a
+    slow upload.
+    """
+
+    def __init__(self, filename=None):
+        name = (filename or '').lower()
+        if name.endswith('.csv'):
+            self.format = 'csv'
+        elif name.endswith(('.ndjson', '.jsonl')):
+            self.format = 'ndjson'
+        else:
+            self.format = 'json'
+
+        self.batch = UploadBatch.objects.create(filename=filename, status='PENDING', ingesting=True)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.tail = ''          # text after the last newline
+        self.csv_lines = _LineFeed()
+        self.csv_reader = csv.reader(self.csv_lines)
+        self.header = None
+        self.json_parts = []
+        self.rows = []
+        self.count = 0
+        self.invalid = 0
+        self.started = False
+        self.error = None
+        self.heartbeat = time.monotonic()
+
+    def feed(self, data):
+        try:
+            self._text(self.decoder.decode(data))
+            if time.monotonic() - self.heartbeat > settings.UPLOAD_INGEST_STALE_SECONDS / 5:
+                self._touch()
+        except Exception:
+            self.abort()
+            raise
+
+    def _touch(self, **fields):
+        UploadBatch.objects.filter(id=self.batch.id).update(updated_at=timezone.now(), **fields)
+        self.heartbeat = time.monotonic()
+
+    def _text(self, text):
+        if self.format == 'json':
+            if text:
+                self.json_parts.append(text)
+            return
+        lines = (self.tail + text).split('\n')
+        self.tail = lines.pop()
+        if self.format == 'csv':
+            self.csv_lines.lines.extend(line + '\n' for line in lines)
+            self._read_csv()
+            return
+        for line in lines:
+            self._ndjson_line(line)
+
+    def _ndjson_line(self, line):
+        if line.strip():
+            try:
+                self.add(json.loads(line))
+            except ValueError:
+                self.invalid += 1
+
+    def _read_csv(self):
+        """Parse every complete CSV record received so far."""
+        feed = self.csv_lines
+        while feed.lines:
+            try:
+                values = next(self.csv_reader)
+            except _Starved:
+                feed.rewind()
+                return
+            except StopIteration:
+                return
+            except csv.Error:
+                # e.g. a field over csv.field_size_limit(): skip that record
+                feed.taken = []
+                self.invalid += 1
+                continue
+            feed.taken = []
+            if not values:
+                continue
+            if self.header is None:
+                self.header = values
+            else:
+                self.add(dict(zip(self.header, values)))
+
+    def add(self, row):
+        self.rows.append(UploadItem(batch=self.batch, payload=row))
+        if len(self.rows) >= settings.UPLOAD_INGEST_CHUNK:
+            self.flush()
+
+    def add_rows(self, rows):
+        try:
+            for row in rows:
+                self.add(row)
+        except Exception:
+            self.abort()
+            raise
+
+    def flush(self):
+        if self.rows:
+            bulk_insert(UploadItem, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+            self._touch(total_items=self.count)
+            publish_progress(self.batch.id, total_items=self.count)
+        if not self.started and self.count:
+            self.started = True
+            process_upload_batch.delay(self.batch.id)
+
+    def finish(self):
+        try:
+            self._finish()
+        except Exception:
+            self.abort()
+            raise
+
+    def _finish(self):
+        self._text(self.decoder.decode(b'', final=True))
+        if self.format == 'json' and self.json_parts:
+            try:
+                items = json.loads(''.join(self.json_parts))
+            except ValueError:
+                items = None
+            self.json_parts = []
+            if not isinstance(items, list):
+                self.error = 'Invalid JSON file'
+                self.abort()
+                return
+            self.add_rows(items)
+        elif self.format == 'csv':
+            if self.tail:
+                self.csv_lines.lines.append(self.tail)
+            # at the end of the file an unterminated quoted field is taken as is
+            self.csv_lines.eof = True
+            self._read_csv()
+        elif self.tail:
+            self._ndjson_line(self.tail)
+
+        self.flush()
+        UploadBatch.objects.filter(id=self.batch.id).update(ingesting=False, total_items=self.count)
+        if not self.started:
+            # nothing to wait for; an empty batch still gets completed
+            self.started = True
+            process_upload_batch.delay(self.batch.id)
+
+    def abort(self):
+        UploadBatch.objects.filter(id=self.batch.id).update(
+            ingesting=False, status='FAILED', updated_at=timezone.now()
+        )
+        publish_progress(self.batch.id, status='FAILED')
+
+    def close(self):
+        # Django closes everything in request.FILES at the end of the request
+        pass
+
+
+class StreamingIngestHandler(FileUploadHandler):
+    """Upload handler feeding the 'file' field into an UploadIngest while the
+    request body is still being received, instead of spooling the whole file
+    to memory or disk first. request.FILES['file'] is the UploadIngest."""
+
+    field_name = 'file'
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.ingest = None
+        if field_name == self.field_name:
+            self.ingest = UploadIngest(file_name)
+            raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.ingest is None:
+            return raw_data
+        self.ingest.feed(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.ingest is None:
+            return None
+        self.ingest.finish()
+        return self.ingest
+
+    def upload_interrupted(self):
+        if getattr(self, 'ingest', None) is not None:
+            self.ingest.abort()
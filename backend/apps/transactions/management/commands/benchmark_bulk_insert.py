@@ -0,0 +1,79 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+
+from apps.transactions.bulk import copy_insert
+from apps.transactions.models import Transaction, UploadBatch, UploadItem
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare bulk_create and COPY inserts of synthetic UploadItem and Transaction rows (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--chunk", type=int, default=5000, help="rows per insert call")
+
+    def handle(self, *args, rows, chunk, **options):
+        methods = {"bulk_create": self.bulk_create}
+        if connection.vendor == "postgresql":
+            methods["copy"] = copy_insert
+            # what save_transactions runs: COPY into a staging table, then ON CONFLICT DO NOTHING
+            methods["copy_ignore"] = self.copy_ignore_conflicts
+        else:
+            self.stdout.write(f"COPY skipped: database is {connection.vendor}, not PostgreSQL")
+
+        self.stdout.write(f"{rows} rows, {chunk} per call")
+        for model in (UploadItem, Transaction):
+            for name, insert in methods.items():
+                seconds = self.run(model, insert, rows, chunk)
+                self.stdout.write(f"{model.__name__:12s} {name:12s} {seconds:8.2f}s  {rows / seconds:10.0f} rows/s")
+
+    @staticmethod
+    def bulk_create(model, objs):
+        model.objects.bulk_create(objs)
+
+    @staticmethod
+    def copy_ignore_conflicts(model, objs):
+        copy_insert(model, objs, ignore_conflicts=True)
+
+    def run(self, model, insert, rows, chunk):
+        try:
+            with db_transaction.atomic():
+                batch = UploadBatch.objects.create(filename="benchmark")
+                make = self.upload_item if model is UploadItem else self.transaction
+                start = time.perf_counter()
+                for offset in range(0, rows, chunk):
+                    insert(model, [make(batch, i) for i in range(offset, min(rows, offset + chunk))])
+                seconds = time.perf_counter() - start
+                raise Rollback()
+        except Rollback:
+            return seconds
+
+    @staticmethod
+    def upload_item(batch, i):
+        return UploadItem(
+            batch=batch,
+            payload={
+                "description": f"UPI/{random.randrange(10**12)}/payment to merchant {i % 977}",
+                "amount": f"{random.uniform(1, 50000):.2f}",
+                "date": "2025-11-03",
+            },
+        )
+
+    @staticmethod
+    def transaction(batch, i):
+        return Transaction(
+            description=f"UPI/{random.randrange(10**12)}/payment to merchant {i % 977}",
+            amount=Decimal(f"{random.uniform(1, 50000):.2f}"),
+            date="2025-11-03",
+            predicted_category="Food & Drink",
+            predicted_score=random.random(),
+            entities=[{"text": f"merchant {i % 977}", "label": "ORG"}],
+        )
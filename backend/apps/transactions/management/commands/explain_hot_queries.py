@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+
+from apps.transactions.models import CategoryData, TaxonomyOutbox, Transaction, UploadBatch, UploadItem
+from apps.transactions.tasks import pending_items
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Print EXPLAIN ANALYZE for the hot queries (list views, exports, relabeling, "
+        "batch item scans, outbox drain), sampling parameters from the current data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--query", action="append", help="only these queries (repeatable)")
+        parser.add_argument("--no-analyze", action="store_true", help="plan only, don't run the queries")
+        parser.add_argument(
+            "--fail-on-seq-scan", action="store_true",
+            help="exit non-zero if a plan sequentially scans one of the app's tables "
+                 "(only meaningful on production-sized data)",
+        )
+
+    def handle(self, *args, query, no_analyze, fail_on_seq_scan, **options):
+        postgres = connection.vendor == "postgresql"
+        if not postgres:
+            self.stdout.write(f"database is {connection.vendor}: plain EXPLAIN only, no ANALYZE")
+        analyze = postgres and not no_analyze
+
+        queries = self.queries()
+        unknown = set(query or ()) - set(queries)
+        if unknown:
+            raise CommandError(f"unknown queries: {', '.join(sorted(unknown))}; known: {', '.join(queries)}")
+
+        seq_scans = []
+        for name, explain in queries.items():
+            if query and name not in query:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}"))
+            plan = explain(analyze)
+            if plan is None:
+                self.stdout.write("skipped: no sample data")
+                continue
+            self.stdout.write(plan)
+            if postgres and any(f'Seq Scan on {table}' in plan for table in self.tables()):
+                seq_scans.append(name)
+
+        if fail_on_seq_scan and seq_scans:
+            raise CommandError(f"sequential scans in: {', '.join(seq_scans)}")
+
+    @staticmethod
+    def tables():
+        return [m._meta.db_table for m in (CategoryData, TaxonomyOutbox, Transaction, UploadBatch, UploadItem)]
+
+    def queries(self):
+        return {
+            "transactions_list": lambda analyze: self.explain(
+                Transaction.objects.order_by('-created_at')[:100], analyze
+            ),
+            "category_data_list": lambda analyze: self.explain(
+                CategoryData.objects.order_by('-created_at')[:100], analyze
+            ),
+            "batch_history": lambda analyze: self.explain(
+                UploadBatch.objects.order_by('-created_at')[:100], analyze
+            ),
+            "export_page": lambda analyze: self.explain(
+                Transaction.objects.order_by('-id').values_list('id', 'description')[:settings.EXPORT_CHUNK], analyze
+            ),
+            "export_page_by_category": self.export_by_category,
+            "relabel_by_description": self.relabel,
+            "batch_pending_items": self.pending_items,
+            "outbox_pending": lambda analyze: self.explain(
+                TaxonomyOutbox.objects.filter(
+                    sent_at__isnull=True,
+                    attempts__lt=settings.TAXONOMY_OUTBOX_MAX_ATTEMPTS,
+                    next_attempt_at__lte=timezone.now(),
+                ).order_by('id')[:settings.TAXONOMY_OUTBOX_BATCH],
+                analyze,
+            ),
+        }
+
+    @staticmethod
+    def explain(qs, analyze):
+        if analyze:
+            return qs.explain(analyze=True, buffers=True)
+        return qs.explain()
+
+    def export_by_category(self, analyze):
+        category = (
+            Transaction.objects.exclude(predicted_category=None)
+            .order_by('-id').values_list('predicted_category', flat=True).first()
+        )
+        if category is None:
+            return None
+        return self.explain(
+            Transaction.objects.filter(predicted_category=category).order_by('-id')
+            .values_list('id', 'description')[:settings.EXPORT_CHUNK],
+            analyze,
+        )
+
+    def pending_items(self, analyze):
+        batch_id = UploadItem.objects.order_by('-id').values_list('batch_id', flat=True).first()
+        if batch_id is None:
+            return None
+        plans = []
+        for retry_failed in (True, False):
+            qs = pending_items(batch_id, retry_failed).order_by('id').only('id', 'payload')[:1000]
+            plans.append(f"-- retry_failed={retry_failed}\n{self.explain(qs, analyze)}")
+        return "\n".join(plans)
+
+    def relabel(self, analyze):
+        # the statement low_confidence_submit runs, rolled back afterwards
+        descriptions = list(Transaction.objects.order_by('-id').values_list('description', flat=True)[:100])
+        if not descriptions:
+            return None
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        values = ', '.join(['(%s, %s)'] * len(descriptions))
+        sql = (
+            f"UPDATE {table} SET user_label = v.column2 FROM (VALUES {values}) AS v "
+            f"WHERE {table}.description = v.column1"
+        )
+        params = [value for d in descriptions for value in (d, 'explain')]
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else (
+            "EXPLAIN " if connection.vendor == "postgresql" else "EXPLAIN QUERY PLAN "
+        )
+        try:
+            with db_transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                plan = "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+                raise Rollback()
+        except Rollback:
+            return plan
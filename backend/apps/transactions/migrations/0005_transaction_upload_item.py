@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_uploadbatch_low_confidence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='upload_item',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transaction', to='transactions.uploaditem'),
+        ),
+    ]
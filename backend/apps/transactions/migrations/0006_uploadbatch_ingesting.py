@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_transaction_upload_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadbatch',
+            name='ingesting',
+            field=models.BooleanField(default=False),
+        ),
+    ]
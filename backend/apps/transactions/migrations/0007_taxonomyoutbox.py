@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_uploadbatch_ingesting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxonomyOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_name', models.CharField(max_length=200)),
+                ('example_text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('version', models.IntegerField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sent_at', 'id'], name='transaction_sent_at_bd0fab_idx')],
+            },
+        ),
+    ]
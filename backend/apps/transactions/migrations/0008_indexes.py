@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction; it keeps the
+    # tables writable while the indexes build
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0007_taxonomyoutbox'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='categorydata',
+            index=models.Index(fields=['created_at'], name='transaction_created_98a4ab_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['created_at'], name='transaction_created_67ce7b_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.HashIndex(fields=['description'], name='transaction_descrip_a41d8c_hash'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['predicted_category', 'id'], name='transaction_predict_d4f764_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='uploadbatch',
+            index=models.Index(fields=['created_at'], name='transaction_created_43d589_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='uploaditem',
+            index=models.Index(fields=['batch', 'saved', 'processed', 'id'], name='transaction_batch_i_eceee7_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taxonomyoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
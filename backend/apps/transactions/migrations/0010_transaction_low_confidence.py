@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_taxonomyoutbox_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='low_confidence',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.contrib.postgres.indexes import HashIndex
 from django.db import models
+from django.utils import timezone
 
 class CategoryData(models.Model):
     category_name = models.CharField(max_length=200)
@@ -7,6 +9,7 @@ class CategoryData(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at'])]
 
     def __str__(self):
         return f"{self.category_name}: {self.example_text[:30]}"
@@ -19,12 +22,27 @@ class Transaction(models.Model):
     user_label = models.CharField(max_length=200, null=True, blank=True)
     predicted_category = models.CharField(max_length=200, null=True, blank=True)
     predicted_score = models.FloatField(null=True, blank=True)
+    # the taxonomy service put it under low_confidence, for review
+    low_confidence = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     # store NER entities as JSON string if needed (optional)
     entities = models.JSONField(null=True, blank=True)
+    # source row for uploaded transactions; unique so a resumed batch can't insert twice
+    upload_item = models.OneToOneField(
+        'UploadItem', null=True, blank=True, on_delete=models.SET_NULL, related_name='transaction'
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # list views sort on it
+            models.Index(fields=['created_at']),
+            # exact-match relabeling by description (low_confidence_submit);
+            # hash, since descriptions can be longer than a btree entry allows
+            HashIndex(fields=['description']),
+            # category-filtered exports, paged by id
+            models.Index(fields=['predicted_category', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.description[:50]} ({self.predicted_category})"
@@ -47,6 +65,11 @@ class UploadBatch(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     low_confidence = models.JSONField(default=list, blank=True)
+    # rows are still being streamed in from the upload (see ingest.py)
+    ingesting = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at'])]
 
 class UploadItem(models.Model):
     batch = models.ForeignKey(UploadBatch, related_name='items', on_delete=models.CASCADE)
@@ -55,3 +78,34 @@ class UploadItem(models.Model):
     saved = models.BooleanField(default=False)
     error = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the batch task's pending-item scans: saved=False (plus
+            # processed=False when following an upload), walked in id order
+            models.Index(fields=['batch', 'saved', 'processed', 'id']),
+        ]
+
+
+class TaxonomyOutbox(models.Model):
+    """A taxonomy example waiting to be sent to the taxonomy service.
+
+    Written in the same DB transaction as the CategoryData it mirrors, and
+    sent in coalesced batches by the drain_taxonomy_outbox task.
+    """
+    category_name = models.CharField(max_length=200)
+    example_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # taxonomy version the example landed in
+    version = models.IntegerField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    # not sent before this: backoff after a failed call, or a drain's lease
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['sent_at', 'id'])]
+
+    def __str__(self):
+        return f"{self.category_name}: {self.example_text[:30]}"
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import CategoryData, TaxonomyOutbox
+from .tasks import drain_taxonomy_outbox
+
+
+def save_examples(pairs):
+    """Save (category, example_text) pairs as CategoryData plus their outbox
+    rows, in one DB transaction, and kick off a drain once it commits.
+    Returns the CategoryData rows created.
+
+    Nothing here talks to the taxonomy service: an example that is saved is
+    also queued, and the outbox retries it until the service takes it."""
+    pairs = [(c.strip(), e.strip()) for c, e in pairs if c and c.strip() and e and e.strip()]
+    if not pairs:
+        return []
+    with db_transaction.atomic():
+        created = CategoryData.objects.bulk_create(
+            [CategoryData(category_name=c, example_text=e) for c, e in pairs], batch_size=1000
+        )
+        TaxonomyOutbox.objects.bulk_create(
+            [TaxonomyOutbox(category_name=c, example_text=e) for c, e in pairs], batch_size=1000
+        )
+        db_transaction.on_commit(lambda: drain_taxonomy_outbox.delay())
+    return created
+
+
+def outbox_metrics():
+    """Backlog and lag of the taxonomy outbox."""
+    now = timezone.now()
+    pending = TaxonomyOutbox.objects.filter(sent_at__isnull=True).aggregate(
+        backlog=Count('id'),
+        retrying=Count('id', filter=Q(attempts__gt=0, attempts__lt=settings.TAXONOMY_OUTBOX_MAX_ATTEMPTS)),
+        # gave up after TAXONOMY_OUTBOX_MAX_ATTEMPTS, needs a look
+        dead=Count('id', filter=Q(attempts__gte=settings.TAXONOMY_OUTBOX_MAX_ATTEMPTS)),
+        oldest=Min('created_at'),
+    )
+    # the latest delivery's version, not the highest ever seen: a
+    # restarted taxonomy service may count from a lower one
+    last_sent = (
+        TaxonomyOutbox.objects.filter(sent_at__isnull=False)
+        .order_by('-sent_at', '-id').values('sent_at', 'version').first()
+    ) or {'sent_at': None, 'version': None}
+    error = (
+        TaxonomyOutbox.objects.filter(sent_at__isnull=True, attempts__gt=0)
+        .order_by('-id').values_list('last_error', flat=True).first()
+    )
+    oldest = pending['oldest']
+    return {
+        'backlog': pending['backlog'],
+        'retrying': pending['retrying'],
+        'dead': pending['dead'],
+        # age of the oldest example the taxonomy service hasn't got yet
+        'lag_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0,
+        'oldest_pending_at': oldest.isoformat() if oldest else None,
+        'last_sent_at': last_sent['sent_at'].isoformat() if last_sent['sent_at'] else None,
+        'last_version': last_sent['version'],
+        'last_error': error or None,
+    }
@@ -0,0 +1,174 @@
+import asyncio
+import json
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from .models import UploadBatch
+
+CHANNEL = "upload-progress:{}"
+FIELDS = ('id', 'status', 'total_items', 'processed', 'saved')
+COUNTERS = ('processed', 'saved')
+DONE = ('COMPLETED', 'FAILED')
+IDLE_SECONDS = 15   # re-check the DB / send an SSE keepalive after this much silence
+
+_redis = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_connect_timeout=1, socket_timeout=1)
+
+
+# ---------- Publishing (Celery tasks, upload views) ----------
+
+def publish_progress(batch_id, **fields):
+    """Publish changed batch fields on the batch's channel once the current
+    DB transaction commits. Best effort: watchers fall back to the DB."""
+    def send():
+        try:
+            _redis.publish(CHANNEL.format(batch_id), json.dumps(fields))
+        except redis.RedisError:
+            pass
+    db_transaction.on_commit(send)
+
+
+def publish_counters(batch_id):
+    """Publish the batch's current processed/saved counters (several range
+    tasks bump them concurrently, so send what's in the row)."""
+    counters = UploadBatch.objects.filter(id=batch_id).values(*COUNTERS).first()
+    if counters:
+        publish_progress(batch_id, **counters)
+
+
+# ---------- Subscribing (async SSE view) ----------
+
+class ProgressHub:
+    """Fans one Redis subscription per batch out to every SSE watcher of that
+    batch in this process.
+
+    Each watcher gets the batch from the DB once on connect, then only the
+    fields that changed, and low_confidence once, at completion. If the
+    channel stays quiet for IDLE_SECONDS the hub re-reads the batch once for
+    all its watchers, so a missed event can't leave them hanging. Malformed
+    messages are skipped; if the listener itself fails, its watchers get a
+    final {'error': ...} event and their streams end.
+    """
+
+    def __init__(self):
+        self.client = None
+        self.watchers = {}      # batch_id -> set of queues
+        self.listeners = {}     # batch_id -> (task, subscribed event)
+
+    async def stream(self, batch_id):
+        queue = await self._join(batch_id)
+        try:
+            sent = await self._read(batch_id)
+            if sent is None:
+                yield self._event({'error': 'not_found'})
+                return
+            yield self._event(sent)
+
+            while sent['status'] not in DONE:
+                try:
+                    update = await asyncio.wait_for(queue.get(), IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if 'error' in update:
+                    yield self._event(update)
+                    return
+                delta = {
+                    k: v for k, v in update.items()
+                    if sent.get(k) != v and not (k in COUNTERS and v < sent.get(k, 0))
+                }
+                if delta:
+                    sent.update(delta)
+                    yield self._event(delta)
+        finally:
+            self._leave(batch_id, queue)
+
+    @staticmethod
+    def _event(data):
+        return f"data: {json.dumps(data)}\n\n"
+
+    @staticmethod
+    async def _read(batch_id):
+        batch = await UploadBatch.objects.filter(id=batch_id).values(*FIELDS, 'low_confidence').afirst()
+        if batch is not None and batch['status'] != 'COMPLETED':
+            batch.pop('low_confidence')
+        return batch
+
+    async def _join(self, batch_id):
+        queue = asyncio.Queue()
+        self.watchers.setdefault(batch_id, set()).add(queue)
+        if batch_id not in self.listeners:
+            subscribed = asyncio.Event()
+            task = asyncio.create_task(self._listen(batch_id, subscribed))
+            self.listeners[batch_id] = (task, subscribed)
+        # subscribe before the watcher's DB read, so no update falls in between
+        await self.listeners[batch_id][1].wait()
+        return queue
+
+    def _leave(self, batch_id, queue):
+        queues = self.watchers.get(batch_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.watchers[batch_id]
+            listener = self.listeners.pop(batch_id, None)
+            if listener is not None:
+                listener[0].cancel()
+
+    def _broadcast(self, batch_id, update):
+        for queue in self.watchers.get(batch_id, ()):
+            queue.put_nowait(update)
+
+    async def _listen(self, batch_id, subscribed):
+        if self.client is None:
+            self.client = aioredis.Redis.from_url(settings.CELERY_BROKER_URL)
+        pubsub = self.client.pubsub()
+        try:
+            try:
+                await pubsub.subscribe(CHANNEL.format(batch_id))
+            except redis.RedisError:
+                pubsub = None   # no Redis: just poll the DB every IDLE_SECONDS
+            subscribed.set()
+
+            while True:
+                message = None
+                if pubsub is not None:
+                    try:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=IDLE_SECONDS)
+                    except redis.RedisError:
+                        await pubsub.close()
+                        pubsub = None
+                else:
+                    await asyncio.sleep(IDLE_SECONDS)
+                if message is None:
+                    update = await self._read(batch_id)
+                else:
+                    try:
+                        update = json.loads(message['data'])
+                    except (ValueError, TypeError, KeyError):
+                        print("malformed progress message for batch", batch_id, message)
+                        continue
+                    if not isinstance(update, dict):
+                        continue
+                    if update.get('status') == 'COMPLETED':
+                        # read once for every watcher of the batch
+                        update = await self._read(batch_id)
+                if update:
+                    self._broadcast(batch_id, update)
+        except Exception as e:
+            # anything else (the DB read, mostly) ends this listener: drop it,
+            # so the next watcher starts a fresh one, and close its watchers
+            print("progress listener for batch", batch_id, "failed:", e)
+            if self.listeners.get(batch_id, (None,))[0] is asyncio.current_task():
+                del self.listeners[batch_id]
+            self._broadcast(batch_id, {'error': 'progress_unavailable'})
+        finally:
+            subscribed.set()
+            if pubsub is not None:
+                await pubsub.close()
+
+
+progress_hub = ProgressHub()
@@ -12,6 +12,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
+        read_only_fields = ['upload_item']
 
 class UploadItemSerializer(serializers.ModelSerializer):
     class Meta:
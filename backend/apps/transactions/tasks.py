@@ -1,160 +1,673 @@
 import json
+import os
+import random
+import resource
 import time
+from collections import deque
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from celery import shared_task
+from requests.adapters import HTTPAdapter
+from celery import chain, chord, shared_task
 from django.conf import settings
 from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
 
-from .models import UploadBatch, UploadItem, Transaction
+from .adaptive import AIMDController
+from .bulk import bulk_insert
+from .circuit import CircuitBreaker
+from .models import TaxonomyOutbox, UploadBatch, UploadItem, Transaction
+from .progress import publish_counters, publish_progress
 
 TAXONOMY_URL = settings.TAXONOMY_HOST.rstrip("/")
 TAXONOMY_BULK_URL = f"{settings.TAXONOMY_HOST_BULK.rstrip('/')}/classify/bulk"
 MAX_RETRIES = 5
 BASE_DELAY = 2
+MAX_DELAY = 60
+OUTBOX_LEASE_SECONDS = 120   # longer than an outbox call's timeout
+TRANSIENT_STATUS = {429, 502, 503, 504}
+# Starting sizes; each range task then adapts them (AIMD) toward the target
+# latencies in settings, see adaptive.py
 BULK_CHUNK = 200   # number of items to send per classify/bulk call
 DB_BULK_CHUNK = 500  # number of Transaction rows to bulk_create at once
+CLASSIFY_TIMEOUT_FACTOR = 5  # classify timeout, in expected call durations
+BISECT_MAX_DEPTH = 2  # levels a failing chunk is split where both halves fail too
 
-def push_example(category, example_text):
-    payload = {"category": category, "example": example_text}
+STAGES = ('read', 'classify', 'classify_wait', 'write')
+
+# Shared across workers so an outage seen by one stops all of them calling
+taxonomy_breaker = CircuitBreaker(
+    'taxonomy',
+    settings.CELERY_BROKER_URL,
+    threshold=settings.TAXONOMY_BREAKER_THRESHOLD,
+    reset_timeout=settings.TAXONOMY_BREAKER_RESET_SECONDS,
+)
+
+class TaxonomyUnavailable(Exception):
+    """The taxonomy service is down or overloaded, or its circuit is open.
+    The work should be deferred, not bisected."""
+
+_session = None
+_session_pid = None
+
+def http_session():
+    """Keep-alive session for classify/bulk calls, one per worker process
+    (never shared across a prefork fork), pooling one connection per
+    in-flight request."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.UPLOAD_INFLIGHT_REQUESTS)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+        _session_pid = os.getpid()
+    return _session
+
+def item_text(payload):
+    return payload.get('description') or payload.get('desc') or ''
+
+def rss_mb():
+    """Current resident set size of this worker process, in MB."""
     try:
-        requests.post(f"{TAXONOMY_URL}/taxonomy/update", json=payload, timeout=5)
-    except Exception as e:
-        # in production you may want to queue retries
-        pass
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        # no procfs: fall back to the peak RSS (KiB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def pending_items(batch_id, retry_failed=True):
+    """A batch's items still to classify: every unsaved item, or with
+    retry_failed=False only those not attempted yet."""
+    qs = UploadItem.objects.filter(batch_id=batch_id, saved=False)
+    return qs if retry_failed else qs.filter(processed=False)
+
+def id_ranges(batch_id, size, retry_failed=True):
+    """Split a batch's pending UploadItem ids into (first_id, last_id) ranges
+    of up to `size` items each, a couple of indexed lookups per range."""
+    ids = pending_items(batch_id, retry_failed).order_by('id').values_list('id', flat=True)
+    ranges = []
+    last_id = 0
+    while True:
+        first = ids.filter(id__gt=last_id).first()
+        if first is None:
+            return ranges
+        end = list(ids.filter(id__gte=first)[size - 1:size])
+        last_id = end[0] if end else ids.last()
+        ranges.append((first, last_id))
+
+def iter_item_chunks(batch_id, size, first_id=1, last_id=None, retry_failed=True):
+    """Yield a batch's pending UploadItems (optionally only ids
+    first_id..last_id) `size` at a time by keyset pagination on id, so only
+    one chunk of rows is loaded at once whatever the batch size. Items saved
+    by an earlier, interrupted run are skipped. `size` may be a callable,
+    asked again for every chunk."""
+    qs = pending_items(batch_id, retry_failed)
+    if last_id is not None:
+        qs = qs.filter(id__lte=last_id)
+    prev_id = first_id - 1
+    while True:
+        chunk = list(
+            qs.filter(id__gt=prev_id)
+            .order_by('id')
+            .only('id', 'payload')[:size() if callable(size) else size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        prev_id = chunk[-1].id
+
+def backoff(attempt):
+    """Full-jitter exponential backoff, so deferred retries don't all come back at once."""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+def post_classify(texts, timeout=60):
+    """One classify/bulk call through the circuit breaker. Raises
+    TaxonomyUnavailable on outages and overload, requests.HTTPError when the
+    service rejected or failed on this input."""
+    if not taxonomy_breaker.allow():
+        raise TaxonomyUnavailable('circuit open')
+    try:
+        r = http_session().post(TAXONOMY_BULK_URL, json={'items': texts}, timeout=timeout)
+    except requests.RequestException as e:
+        taxonomy_breaker.record_failure()
+        raise TaxonomyUnavailable(str(e)) from e
+    if r.status_code in TRANSIENT_STATUS:
+        taxonomy_breaker.record_failure()
+        raise TaxonomyUnavailable(f"HTTP {r.status_code}")
+    if r.status_code >= 500:
+        # a bad input or a failing service, classify_chunk tells them apart;
+        # either way it counts toward opening the circuit
+        taxonomy_breaker.record_failure()
+    else:
+        taxonomy_breaker.record_success()
+    r.raise_for_status()
+    return r.json()
+
+def try_classify(texts, timeout):
+    """post_classify, or None if the service rejected or failed on texts."""
+    try:
+        resp_json = post_classify(texts, timeout)
+        resp_json.setdefault('failed', [])
+        return resp_json
+    except (requests.HTTPError, ValueError) as e:
+        print("ERROR calling TAXONOMY SERVICE:", e)
+        return None
+
+def classify_chunk(texts, timeout=60, depth=BISECT_MAX_DEPTH):
+    """POST texts to classify/bulk. A chunk the service rejects or fails on
+    is bisected until the bad inputs are isolated, so one poison text doesn't
+    fail the rest. Texts rejected on their own are returned under 'failed'.
+
+    Both halves are tried before either is split further. While one of them
+    goes through the failure is down to the inputs and bisection goes on;
+    when both fail the service itself may be failing, so that only goes on
+    for `depth` more levels before the rest is given up on (and 5xx replies
+    open the circuit, see post_classify). TaxonomyUnavailable propagates so
+    the caller can defer the chunk."""
+    resp_json = try_classify(texts, timeout)
+    if resp_json is not None:
+        return resp_json
+    return bisect_chunk(texts, timeout, depth)
+
+def bisect_chunk(texts, timeout, depth):
+    merged = {'high_confidence': [], 'low_confidence': [], 'failed': []}
+    if len(texts) == 1:
+        merged['failed'] = list(texts)
+        return merged
+    mid = len(texts) // 2
+    halves = [texts[:mid], texts[mid:]]
+    results = [try_classify(half, timeout) for half in halves]
+    if all(resp_json is None for resp_json in results):
+        depth -= 1
+    for half, resp_json in zip(halves, results):
+        if resp_json is None:
+            if depth >= 0:
+                resp_json = bisect_chunk(half, timeout, depth)
+            else:
+                resp_json = {'high_confidence': [], 'low_confidence': [], 'failed': list(half)}
+        for key in merged:
+            merged[key] += resp_json[key]
+    return merged
+
+def timed_classify(texts, timeout):
+    start = time.perf_counter()
+    resp_json = classify_chunk(texts, timeout)
+    return resp_json, time.perf_counter() - start
+
+def classify_pipeline(chunks, inflight, timings, timeout):
+    """Yield (chunk_items, chunk_texts, resp_json, seconds) in chunk order
+    while keeping up to `inflight` classify/bulk calls running ahead on a
+    thread pool, so the caller's DB writes overlap with the requests for the
+    next chunks. Reads and writes stay on the calling thread (and its DB
+    connection). `timeout()` gives the request timeout at submit time."""
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=inflight) as pool:
+        while True:
+            while len(pending) < inflight:
+                start = time.perf_counter()
+                chunk_items = next(chunks, None)
+                timings['read'] += time.perf_counter() - start
+                if chunk_items is None:
+                    break
+                chunk_texts = [item_text(it.payload) for it in chunk_items]
+                pending.append((chunk_items, chunk_texts, pool.submit(timed_classify, chunk_texts, timeout())))
+            if not pending:
+                return
+
+            chunk_items, chunk_texts, future = pending.popleft()
+            start = time.perf_counter()
+            resp_json, elapsed = future.result()
+            timings['classify_wait'] += time.perf_counter() - start
+            timings['classify'] += elapsed
+            yield chunk_items, chunk_texts, resp_json, elapsed
+
+def pair_results(resp_json, chunk_texts, chunk_items):
+    """classify/bulk returns results split into high/low confidence lists, not
+    in request order. Pair each result back with the item whose text it was
+    classified from."""
+    items_by_text = {}
+    for text, it in zip(chunk_texts, chunk_items):
+        items_by_text.setdefault(text, []).append(it)
+    pairs = []
+    for res_item in resp_json["high_confidence"] + resp_json["low_confidence"]:
+        waiting = items_by_text.get(res_item.get('text'))
+        if waiting:
+            pairs.append((res_item, waiting.pop(0)))
+    return pairs
+
+def save_transactions(batch_id, created_transactions):
+    """Insert a buffer of (Transaction, UploadItem) pairs and record it in a
+    single DB transaction: one COPY (or multi-row INSERT), one UPDATE for the items and
+    one for the batch counters, instead of a save() per row. Counters are
+    incremented in SQL since several range tasks write the same batch.
+
+    Each call is a checkpoint: its items are saved=True only once their
+    transactions are committed, and the unique Transaction.upload_item link
+    turns a replayed insert into a no-op."""
+    to_create = [t for (t, it) in created_transactions]
+    with db_transaction.atomic():
+        bulk_insert(Transaction, to_create, ignore_conflicts=True)
+        UploadItem.objects.filter(id__in=[it.id for (_, it) in created_transactions]).update(
+            processed=True, saved=True, error=''
+        )
+        UploadBatch.objects.filter(id=batch_id).update(
+            processed=F('processed') + len(to_create), saved=F('saved') + len(to_create)
+        )
+        publish_counters(batch_id)
+    return len(to_create)
+
+def low_confidence_items(batch_id):
+    """The batch's transactions flagged low_confidence, oldest first, shaped
+    like classify/bulk's low_confidence entries for the review screen."""
+    rows = (
+        Transaction.objects.filter(upload_item__batch_id=batch_id, low_confidence=True)
+        .order_by('id').values_list('description', 'predicted_category', 'predicted_score', 'entities')
+    )
+    return [
+        {
+            'text': text,
+            'category': {'name': category} if category else None,
+            'score': score,
+            'entities': entities or [],
+        }
+        for text, category, score, entities in rows.iterator(chunk_size=2000)
+    ]
+
+def mark_failed(batch_id, items, error):
+    """Mark `items` (a queryset) processed but unsaved; one UPDATE each for the
+    items and the batch counter. Returns how many were marked."""
+    with db_transaction.atomic():
+        count = items.update(processed=True, saved=False, error=error)
+        UploadBatch.objects.filter(id=batch_id).update(processed=F('processed') + count)
+        publish_counters(batch_id)
+    return count
 
 @shared_task(bind=True)
-def process_upload_batch(self, batch_id):
+def process_upload_batch(self, batch_id, retry_failed=True):
+    """Fan a batch out over UploadItem id ranges.
+
+    Ranges of UPLOAD_RANGE_SIZE items are dealt round-robin onto at most
+    UPLOAD_BATCH_CONCURRENCY chains, so one batch never runs more than that
+    many range tasks at once, and a chord over the chains calls
+    finish_upload_batch when every range is done.
+
+    With retry_failed=False only items never attempted are picked up; that's
+    how finish_upload_batch follows rows still streaming in from the upload.
+    """
     print("Processing batch:", batch_id)
     try:
         batch = UploadBatch.objects.get(id=batch_id)
     except UploadBatch.DoesNotExist:
         return {'error': 'batch not found'}
+    if not retry_failed and batch.status == 'FAILED':
+        # a follow-up round for an upload that was aborted meanwhile
+        return {'error': 'batch failed'}
 
+    # Re-running a batch resumes it: saved items are kept and skipped, items
+    # that failed are tried again (unless retry_failed=False). They go back to
+    # unattempted here, so the range tasks only ever pick up unattempted
+    # items and one marked failed during this run stays done (and counted
+    # once) however often its range is retried.
+    if retry_failed:
+        batch.items.filter(saved=False, processed=True).update(processed=False)
+    total = batch.items.count()
     batch.status = 'IN_PROGRESS'
-    batch.save(update_fields=['status'])
-
-    items_qs = batch.items.all()
-    total = items_qs.count()
     batch.total_items = total
-    batch.save(update_fields=['total_items'])
+    batch.processed = batch.items.filter(processed=True).count()
+    batch.saved = batch.items.filter(saved=True).count()
+    batch.save(update_fields=['status', 'total_items', 'processed', 'saved'])
+    publish_progress(
+        batch.id, status=batch.status, total_items=total, processed=batch.processed, saved=batch.saved
+    )
+
+    ranges = id_ranges(batch.id, settings.UPLOAD_RANGE_SIZE, retry_failed=False)
+    if not ranges:
+        return finish_upload_batch([], batch.id)
+
+    lanes = [[] for _ in range(min(settings.UPLOAD_BATCH_CONCURRENCY, len(ranges)))]
+    for i, id_range in enumerate(ranges):
+        lanes[i % len(lanes)].append(id_range)
+
+    # Each task in a chain gets the previous one's result as its first argument
+    header = [
+        chain(
+            process_item_range.s(None, batch.id, *lane[0]),
+            *[process_item_range.s(batch.id, *id_range) for id_range in lane[1:]]
+        )
+        for lane in lanes
+    ]
+    callback = finish_upload_batch.s(batch.id).on_error(fail_upload_batch.si(batch.id))
+    chord(header)(callback)
+
+    return {'batch_id': batch.id, 'ranges': len(ranges), 'lanes': len(lanes)}
+
+# acks_late: a range whose worker died is redelivered and picks up after
+# its last checkpoint
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=MAX_RETRIES)
+def process_item_range(self, prev, batch_id, first_id, last_id):
+    """Classify and save the batch items with ids first_id..last_id.
+
+    Returns the running totals of its chain (prev plus this range) for
+    finish_upload_batch, including seconds spent per stage: reading items,
+    classify requests (summed over concurrent calls), waiting on them, and
+    DB writes.
+
+    If the taxonomy service is unavailable the task saves what it has and
+    retries itself later (jittered, never before the circuit half-opens),
+    resuming from the first item not yet attempted. Once out of retries the rest of the
+    range is marked failed.
+
+    Classify chunk and write buffer sizes adapt to the measured latencies and
+    carry over to the next range in the chain and into retries.
+    """
+    prev = prev or {'saved': 0, 'processed': 0, 'timings': dict.fromkeys(STAGES, 0.0)}
+    sizes = prev.get('chunk_sizes') or {}
+    classify_ctl = AIMDController.resume(
+        sizes.get('classify'),
+        BULK_CHUNK,
+        settings.UPLOAD_CLASSIFY_CHUNK_MIN,
+        settings.UPLOAD_CLASSIFY_CHUNK_MAX,
+        settings.UPLOAD_CLASSIFY_TARGET_SECONDS,
+    )
+    write_ctl = AIMDController.resume(
+        sizes.get('write'),
+        DB_BULK_CHUNK,
+        settings.UPLOAD_WRITE_CHUNK_MIN,
+        settings.UPLOAD_WRITE_CHUNK_MAX,
+        settings.UPLOAD_WRITE_TARGET_SECONDS,
+    )
+
+    def classify_timeout():
+        return classify_ctl.timeout(
+            CLASSIFY_TIMEOUT_FACTOR, settings.UPLOAD_CLASSIFY_TIMEOUT_MIN, settings.UPLOAD_CLASSIFY_TIMEOUT_MAX
+        )
+
+    def flush(created_transactions):
+        start = time.perf_counter()
+        count = save_transactions(batch_id, created_transactions)
+        elapsed = time.perf_counter() - start
+        timings['write'] += elapsed
+        write_ctl.observe(len(created_transactions), elapsed)
+        return count
 
     saved_count = 0
     processed_count = 0
+    timings = dict.fromkeys(STAGES, 0.0)
+    unavailable = None
 
-    # Collect payloads in lists (maintain mapping to UploadItem ids)
-    id_to_item = {}
-    payload_texts = []
-    payload_items_order = []
+    # Stream items chunk by chunk through taxonomy bulk classify,
+    # UPLOAD_INFLIGHT_REQUESTS chunks ahead of the writes; at most those chunks
+    # plus the unsaved write buffer are held in memory
+    created_transactions = []
+    chunks = iter_item_chunks(batch_id, lambda: classify_ctl.value, first_id, last_id, retry_failed=False)
+    pipeline = classify_pipeline(chunks, settings.UPLOAD_INFLIGHT_REQUESTS, timings, classify_timeout)
+    try:
+        for chunk_items, chunk_texts, resp_json, elapsed in pipeline:
+            classify_ctl.observe(len(chunk_items), elapsed)
 
-    all_low_confidence = []
+            # resp_json expected { low_confidence: [ { text, category, score, entities }, ... ] };
+            # those are flagged on their Transaction, committed with it
+            low_confidence = {id(res_item) for res_item in resp_json["low_confidence"]}
 
-    for it in items_qs:
-        payload = it.payload
-        text = payload.get('description') or payload.get('desc') or ''
-        payload_texts.append(text)
-        payload_items_order.append(it)
-        id_to_item[it.id] = it
+            paired = set()
+            for res_item, upload_item in pair_results(resp_json, chunk_texts, chunk_items):
+                category = (res_item.get('category') or {}).get('name')
+                score = res_item.get('score')
+                entities = res_item.get('entities', [])
 
-    # Process in chunks (BULK_CHUNK) to send to taxonomy bulk classify
-    created_transactions = []
-    for i in range(0, len(payload_texts), BULK_CHUNK):
-        chunk_texts = payload_texts[i:i+BULK_CHUNK]
-        chunk_items = payload_items_order[i:i+BULK_CHUNK]
-
-        # Retry with exponential backoff
-        attempt = 0
-        success = False
-        resp_json = None
-        while attempt < MAX_RETRIES and not success:
-            try:
-                r = requests.post(TAXONOMY_BULK_URL, json={'items': chunk_texts}, timeout=60)
-                r.raise_for_status()
-                resp_json = r.json()
-                success = True
-            except Exception as e:
-                print("ERROR calling TAXONOMY SERVICE:", e)
-                attempt += 1
-                delay = BASE_DELAY * (2 ** (attempt - 1))
-                time.sleep(delay)
-        if not success:
-            # mark these items as processed failed
-            for it in chunk_items:
-                it.processed = True
-                it.saved = False
-                it.error = f"taxonomy_bulk_failed after {MAX_RETRIES} attempts"
-                it.save(update_fields=['processed', 'saved', 'error'])
+                payload = upload_item.payload
+                tr = Transaction(
+                    description=item_text(payload),
+                    amount=payload.get('amount') or None,
+                    date=payload.get('date') or None,
+                    user_label=None,
+                    predicted_category=category,
+                    predicted_score=score,
+                    low_confidence=id(res_item) in low_confidence,
+                    entities=entities,
+                    upload_item=upload_item,
+                )
+                created_transactions.append((tr, upload_item))
+                paired.add(upload_item.id)
                 processed_count += 1
-            batch.processed = processed_count
-            batch.save(update_fields=['processed'])
-            continue
-
-        # resp_json expected { low_confidence: [ { text, category, score, entities }, ... ] }
-        results = resp_json["high_confidence"] + resp_json["low_confidence"]
-
-        # accumulate low-confidence items across all chunks to reprot later
-        all_low_confidence.extend(resp_json["low_confidence"])
-       
-        print(len(results))
- 
-        for res_item, upload_item in zip(results, chunk_items):
-            category = res_item.get('category', {}).get('name')
-            score = res_item.get('score')
-            entities = res_item.get('entities', [])
-
-            payload = upload_item.payload
-            tr = Transaction(
-                description=payload.get('description') or payload.get('desc') or '',
-                amount=payload.get('amount') or None,
-                date=payload.get('date') or None,
-                user_label=None,
-                predicted_category=category,
-                predicted_score=score,
-                entities=entities
-            )
-            created_transactions.append((tr, upload_item))
-
-            # mark upload_item processed but saved will be set after DB insertion
-            upload_item.processed = True
-            upload_item.error = ''
-            upload_item.save(update_fields=['processed', 'error'])
-            processed_count += 1
-
-        # bulk insert DB_BULK_CHUNK at a time
-        if len(created_transactions) >= DB_BULK_CHUNK:
-            to_create = [t for (t, it) in created_transactions]
-            with db_transaction.atomic():
-                Transaction.objects.bulk_create(to_create)
-            saved_count += len(to_create)
-            # mark corresponding UploadItems saved=True
-            for (_, it) in created_transactions:
-                it.saved = True
-                it.save(update_fields=['saved'])
-            created_transactions = []
-            batch.saved = saved_count
-            batch.processed = processed_count
-            batch.save(update_fields=['saved', 'processed'])
+
+            # items the service rejected even on their own (see classify_chunk)
+            rejected = [it.id for it in chunk_items if it.id not in paired]
+            if rejected:
+                start = time.perf_counter()
+                processed_count += mark_failed(
+                    batch_id, UploadItem.objects.filter(id__in=rejected), "taxonomy_bulk_rejected"
+                )
+                timings['write'] += time.perf_counter() - start
+
+            # bulk insert write_ctl.value rows at a time, or sooner when near the ceiling
+            if len(created_transactions) >= write_ctl.value or rss_mb() > settings.UPLOAD_MEMORY_CEILING_MB:
+                saved_count += flush(created_transactions)
+                created_transactions = []
+    except TaxonomyUnavailable as e:
+        print("TAXONOMY SERVICE unavailable:", e)
+        unavailable = e
+        classify_ctl.backoff()
 
     # flush remaining
     if created_transactions:
-        to_create = [t for (t, it) in created_transactions]
-        with db_transaction.atomic():
-            Transaction.objects.bulk_create(to_create)
-        saved_count += len(to_create)
-        for (_, it) in created_transactions:
-            it.saved = True
-            it.save(update_fields=['saved'])
-        batch.saved = saved_count
-
-    batch.processed = processed_count
-    batch.status = 'COMPLETED'
-    batch.low_confidence = all_low_confidence
-
-    batch.save(update_fields=['processed','saved','status','low_confidence'])
-
-    results_low_confidence = all_low_confidence
-    # SAVE INTO DB so SSE can read it
-   # batch.low_confidence = results_low_confidence
-    #batch.save(update_fields=['low_confidence'])
-
-    return {'saved': saved_count, 'processed': processed_count, 'results_low_confidence': results_low_confidence }
\ No newline at end of file
+        saved_count += flush(created_transactions)
+
+    totals = {
+        'saved': prev['saved'] + saved_count,
+        'processed': prev['processed'] + processed_count,
+        'timings': {stage: prev['timings'][stage] + timings[stage] for stage in STAGES},
+        'chunk_sizes': {'classify': classify_ctl.state(), 'write': write_ctl.state()},
+    }
+
+    if unavailable is not None:
+        if self.request.retries < self.max_retries:
+            countdown = max(taxonomy_breaker.retry_in(), backoff(self.request.retries))
+            # carry this attempt's totals into the retry
+            raise self.retry(
+                args=(totals, batch_id, first_id, last_id), countdown=countdown, exc=unavailable
+            )
+        remaining = pending_items(batch_id, retry_failed=False).filter(id__gte=first_id, id__lte=last_id)
+        totals['processed'] += mark_failed(
+            batch_id, remaining, f"taxonomy_bulk_failed after {self.max_retries + 1} attempts"
+        )
+
+    return totals
+
+@shared_task
+def finish_upload_batch(results, batch_id):
+    """Chord callback: mark the batch COMPLETED with its low-confidence items,
+    read back from the transactions flagged when they were saved (this run's
+    and any earlier run's), see low_confidence_items().
+
+    While the upload is still streaming rows in (or rows landed after this
+    round picked its ranges) it schedules another round for the new rows
+    instead. An upload that was aborted leaves the batch FAILED, and one
+    whose ingest stopped without finishing or aborting (the web process
+    died) is failed once it has been silent for UPLOAD_INGEST_STALE_SECONDS."""
+    batch = UploadBatch.objects.get(id=batch_id)
+    if results:
+        # final adaptive sizes of each chain, for capacity tuning
+        batch.metadata = {
+            **(batch.metadata or {}),
+            'chunk_sizes': [
+                {'classify': res['chunk_sizes']['classify']['size'], 'write': res['chunk_sizes']['write']['size']}
+                for res in results
+            ],
+        }
+
+    stalled = batch.ingesting and (
+        batch.updated_at < timezone.now() - timedelta(seconds=settings.UPLOAD_INGEST_STALE_SECONDS)
+    )
+    if stalled:
+        batch.ingesting = False
+        batch.status = 'FAILED'
+        batch.metadata = {**(batch.metadata or {}), 'error': 'upload stalled'}
+        batch.low_confidence = low_confidence_items(batch_id)
+        batch.save(update_fields=['ingesting', 'status', 'low_confidence', 'metadata'])
+        publish_progress(batch_id, status='FAILED')
+    elif batch.status == 'FAILED':
+        batch.low_confidence = low_confidence_items(batch_id)
+        batch.save(update_fields=['low_confidence', 'metadata'])
+    elif batch.ingesting or pending_items(batch_id, retry_failed=False).exists():
+        batch.save(update_fields=['metadata'])
+        process_upload_batch.apply_async(
+            (batch_id,),
+            {'retry_failed': False},
+            countdown=settings.UPLOAD_INGEST_POLL_SECONDS if batch.ingesting else 0,
+        )
+    else:
+        batch.status = 'COMPLETED'
+        # SAVE INTO DB so SSE can read it
+        batch.low_confidence = low_confidence_items(batch_id)
+        batch.save(update_fields=['status', 'low_confidence', 'metadata'])
+        # watchers read low_confidence from the row once they see this
+        publish_progress(batch_id, status='COMPLETED')
+
+    return {
+        'saved': sum(res['saved'] for res in results),
+        'processed': sum(res['processed'] for res in results),
+        'timings': {stage: round(sum(res['timings'][stage] for res in results), 3) for stage in STAGES},
+        'low_confidence': len(batch.low_confidence or []),
+    }
+
+def outbox_backoff(attempts):
+    """Seconds before an outbox row that failed `attempts` times is tried
+    again: jittered exponential from TAXONOMY_OUTBOX_INTERVAL_SECONDS, capped
+    at TAXONOMY_OUTBOX_MAX_BACKOFF_SECONDS."""
+    delay = settings.TAXONOMY_OUTBOX_INTERVAL_SECONDS * (2 ** min(attempts, 20))
+    return random.uniform(0.5, 1) * min(settings.TAXONOMY_OUTBOX_MAX_BACKOFF_SECONDS, delay)
+
+def claim_outbox_rows():
+    """Lease the next due outbox rows for OUTBOX_LEASE_SECONDS, oldest first,
+    skipping rows locked by a concurrent drain. The transaction only covers
+    the claim, no row lock is held while they are sent. Rows of a drain that
+    dies mid-call come due again when their lease runs out."""
+    now = timezone.now()
+    with db_transaction.atomic():
+        rows = list(
+            TaxonomyOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                sent_at__isnull=True,
+                attempts__lt=settings.TAXONOMY_OUTBOX_MAX_ATTEMPTS,
+                next_attempt_at__lte=now,
+            )
+            .order_by('id')[:settings.TAXONOMY_OUTBOX_BATCH]
+        )
+        TaxonomyOutbox.objects.filter(id__in=[r.id for r in rows]).update(
+            next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        )
+    return rows
+
+def defer_outbox_rows(rows, error):
+    """Record a failed call on rows: one more attempt each, next try after
+    outbox_backoff()."""
+    now = timezone.now()
+    for attempts in {r.attempts for r in rows}:
+        TaxonomyOutbox.objects.filter(id__in=[r.id for r in rows], attempts=attempts).update(
+            attempts=attempts + 1,
+            last_error=error,
+            next_attempt_at=now + timedelta(seconds=outbox_backoff(attempts)),
+        )
+    print("taxonomy outbox drain failed:", error)
+
+def send_outbox_rows(rows):
+    """POST claimed rows to /taxonomy/update/bulk, duplicates coalesced into
+    one example, and record the outcome on them.
+
+    An open circuit makes no call and costs no attempt: the rows just wait
+    for it to half-open. Outages and 5xx count an attempt and back off. A
+    batch the service rejects (4xx) is bisected until the bad rows are
+    isolated; those are given up on at once. Returns (rows sent, whether the
+    drain should go on)."""
+    ids = [r.id for r in rows]
+    if not taxonomy_breaker.allow():
+        TaxonomyOutbox.objects.filter(id__in=ids).update(
+            next_attempt_at=timezone.now() + timedelta(seconds=taxonomy_breaker.retry_in()),
+            last_error='circuit open',
+        )
+        return 0, False
+
+    examples = {(r.category_name.strip().lower(), r.example_text.strip()): r for r in rows}
+    payload = {'examples': [
+        {'category': r.category_name.strip(), 'example': r.example_text.strip()}
+        for r in examples.values()
+    ]}
+    try:
+        r = http_session().post(f"{TAXONOMY_URL}/taxonomy/update/bulk", json=payload, timeout=30)
+    except requests.RequestException as e:
+        taxonomy_breaker.record_failure()
+        defer_outbox_rows(rows, str(e) or e.__class__.__name__)
+        return 0, False
+    if r.status_code in TRANSIENT_STATUS or r.status_code >= 500:
+        taxonomy_breaker.record_failure()
+        defer_outbox_rows(rows, f"HTTP {r.status_code}")
+        return 0, False
+    taxonomy_breaker.record_success()
+
+    if r.status_code >= 400:
+        if len(examples) == 1:
+            TaxonomyOutbox.objects.filter(id__in=ids).update(
+                attempts=settings.TAXONOMY_OUTBOX_MAX_ATTEMPTS,
+                last_error=f"rejected: HTTP {r.status_code} {r.text[:200]}",
+            )
+            print("taxonomy outbox rows rejected:", ids)
+            return 0, True
+        mid = len(rows) // 2
+        sent, go_on = send_outbox_rows(rows[:mid])
+        if not go_on:
+            # the rest keep their lease and come due after it
+            return sent, False
+        right_sent, go_on = send_outbox_rows(rows[mid:])
+        return sent + right_sent, go_on
+
+    try:
+        version = r.json().get('version')
+    except ValueError:
+        defer_outbox_rows(rows, "invalid JSON response")
+        return 0, False
+    TaxonomyOutbox.objects.filter(id__in=ids).update(sent_at=timezone.now(), version=version, last_error='')
+    return len(ids), True
+
+def prune_sent_outbox_rows():
+    """Delete rows sent more than TAXONOMY_OUTBOX_RETENTION_SECONDS ago,
+    except the latest one, which outbox_metrics reports the last delivery
+    from. Returns how many were deleted."""
+    cutoff = timezone.now() - timedelta(seconds=settings.TAXONOMY_OUTBOX_RETENTION_SECONDS)
+    latest = (
+        TaxonomyOutbox.objects.filter(sent_at__isnull=False)
+        .order_by('-sent_at', '-id').values_list('id', flat=True).first()
+    )
+    deleted, _ = TaxonomyOutbox.objects.filter(sent_at__lt=cutoff).exclude(id=latest).delete()
+    return deleted
+
+@shared_task
+def drain_taxonomy_outbox():
+    """Send pending outbox examples to /taxonomy/update/bulk.
+
+    Runs on a beat schedule and right after examples are saved, claiming
+    TAXONOMY_OUTBOX_BATCH due rows at a time (see claim_outbox_rows) and
+    sending them with send_outbox_rows. Failed rows are retried on a
+    per-row backoff until TAXONOMY_OUTBOX_MAX_ATTEMPTS calls have failed;
+    after that they are left for an operator (see outbox_metrics' dead
+    count). Delivery is at-least-once: the taxonomy service skips examples
+    a category already has, so a resent row is harmless. Sent rows are
+    pruned once they are TAXONOMY_OUTBOX_RETENTION_SECONDS old."""
+    sent = 0
+    # retry_in() rather than allow(): allow() would take the half-open probe
+    while taxonomy_breaker.retry_in() == 0:
+        rows = claim_outbox_rows()
+        if not rows:
+            break
+        count, go_on = send_outbox_rows(rows)
+        sent += count
+        if not go_on:
+            break
+    return {'sent': sent, 'pruned': prune_sent_outbox_rows()}
+
+@shared_task
+def fail_upload_batch(batch_id):
+    UploadBatch.objects.filter(id=batch_id).update(status='FAILED')
+    publish_progress(batch_id, status='FAILED')
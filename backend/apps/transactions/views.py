@@ -6,16 +6,16 @@ from .models import Transaction, CategoryData
 from .serializers import TransactionSerializer, CategoryDataSerializer
 from django.conf import settings
 import requests
-from django.db import transaction
+from django.db import connection, transaction
 
 from django.http import StreamingHttpResponse
-from .models import UploadBatch, UploadItem
-from .tasks import process_upload_batch
+from .models import UploadBatch
+from .export import ExportError, export_response
+from .ingest import StreamingIngestHandler, UploadIngest
+from .progress import progress_hub
 from .serializers import UploadBatchSerializer
-import json, csv
-from io import StringIO
+from .outbox import outbox_metrics, save_examples
 
-from django.http import HttpResponse, JsonResponse
 
 
 TAXONOMY_URL = settings.TAXONOMY_HOST.rstrip("/")
@@ -33,7 +33,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
             r = requests.post(f"{TAXONOMY_URL}/match", json={"text": description}, timeout=5)
             if r.ok:
                 js = r.json()
-                data['predicted_category'] = js.get('category', {}).get('name')
+                data['predicted_category'] = (js.get('category') or {}).get('name')
                 data['predicted_score'] = js.get('score')
                 data['entities'] = js.get('entities') or []
         except Exception as e:
@@ -42,17 +42,12 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-
-        # If user_label provided in payload, save CategoryData and sync taxonomy
-        if data.get('user_label'):
-            # create example
-            CategoryData.objects.create(category_name=data['user_label'], example_text=description)
-            # push to taxonomy service
-            try:
-                requests.post(f"{TAXONOMY_URL}/taxonomy/update", json={"category": data['user_label'], "example": description}, timeout=5)
-            except Exception:
-                pass
+        with transaction.atomic():
+            self.perform_create(serializer)
+            # If user_label provided in payload, save CategoryData; the
+            # taxonomy service gets it through the outbox
+            if data.get('user_label'):
+                save_examples([(data['user_label'], description)])
 
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -62,92 +57,40 @@ class CategoryDataViewSet(viewsets.ModelViewSet):
     queryset = CategoryData.objects.all().order_by('-created_at')
     serializer_class = CategoryDataSerializer
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        # push update to taxonomy service
-        try:
-            requests.post(f"{TAXONOMY_URL}/taxonomy/update", json=serializer.data, timeout=5)
-        except Exception:
-            pass
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def perform_create(self, serializer):
+        # saved together with its outbox row for the taxonomy service
+        data = serializer.validated_data
+        serializer.instance = save_examples([(data['category_name'], data['example_text'])])[0]
     
 
 # upload endpoint: accepts multipart file upload OR JSON body with items
 @api_view(['POST'])
 def upload_file(request):
-    items = None
-    filename = None
+    # Parse the file and insert its rows while the body is still arriving,
+    # see ingest.py. Must be set up before request.FILES is touched.
+    request.upload_handlers.insert(0, StreamingIngestHandler(request._request))
 
     if 'file' in request.FILES:
-        f = request.FILES['file']
-        filename = getattr(f, 'name', None)
-        content = f.read().decode('utf-8')
-        # CSV or JSON
-        if filename and filename.lower().endswith('.csv'):
-            sio = StringIO(content)
-            reader = csv.DictReader(sio)
-            items = [row for row in reader]
-        else:
-            try:
-                items = json.loads(content)
-            except Exception:
-                return Response({'error': 'Invalid JSON file'}, status=400)
+        ingest = request.FILES['file']
+        if ingest.error:
+            return Response({'error': ingest.error}, status=400)
     else:
         items = request.data.get('items')
         if not items:
             return Response({'error': 'No items'}, status=400)
+        ingest = UploadIngest()
+        ingest.add_rows(items)
+        ingest.finish()
 
-    # create batch
-    batch = UploadBatch.objects.create(filename=filename, total_items=len(items), status='PENDING')
-
-    # create UploadItem objects
-    objs = [UploadItem(batch=batch, payload=item) for item in items]
-
-    UploadItem.objects.bulk_create(objs)
-
+    # the Celery task processing the batch was started by the ingest
+    print("BATCHID->", ingest.batch.id)
+    return Response({'batch_id': ingest.batch.id, 'message': 'Batch queued', 'items': ingest.count})
 
-    # kick off Celery task to process batch asynchronously and categorize the transactions
-    resp = process_upload_batch.delay(batch.id)
-    print("BATCHID->", batch.id)
-
-    print("TESTING STREAMING RESPONSE")
-    return Response({'batch_id': batch.id, 'message': 'Batch queued'})
-
-# SSE stream generator
-def event_stream(batch_id):
-    import time
-    from django.utils import timezone
-    while True:
-        try:
-            batch = UploadBatch.objects.get(id=batch_id)
-        except UploadBatch.DoesNotExist:
-            yield f"data: {json.dumps({'error': 'not_found'})}\n\n"
-            break
-        payload = {
-            'id': batch.id,
-            'status': batch.status,
-            'total_items': batch.total_items,
-            'processed': batch.processed,
-            'saved': batch.saved,
-            'updated_at': batch.updated_at.isoformat(),
-            'low_confidence': batch.low_confidence 
-        }
-
-        #if batch.status == "COMPLETED":
-         #   payload['low_confidence'] = batch.low_confidence
-        
-        yield f"data: {json.dumps(payload)}\n\n"
-        
-        if batch.status in ('COMPLETED', 'FAILED'):
-            break
-        time.sleep(1)
-
-# SSE view
-def upload_stream(request, batch_id):
+# SSE view: progress is pushed from the batch tasks over Redis (see progress.py).
+# Async, served by the ASGI django-stream service.
+async def upload_stream(request, batch_id):
     response = StreamingHttpResponse(
-        event_stream(batch_id),
+        progress_hub.stream(batch_id),
         content_type='text/event-stream'
     )
     response['Cache-Control'] = 'no-cache'
@@ -161,41 +104,40 @@ def low_confidence_submit(request):
     if not items:
         return Response({"error": "No items provided"}, status=400)
 
-    updated = 0
+    # last correction of a text wins
+    corrections = {}
+    for it in items:
+        text = it.get("text")
+        corrected = it.get("corrected")
+        if text and corrected:
+            corrections[text] = corrected
 
     with transaction.atomic():
-        for it in items:
-            text = it["text"]
-            corrected = it["corrected"]
+        # 1. Save corrected mappings for future training, queued for the
+        # taxonomy service in the same transaction
+        save_examples((corrected, text) for text, corrected in corrections.items())
+        # 2. Update existing Transaction rows
+        relabel_transactions(corrections)
 
-            if not corrected:
-                continue
-
-            # 1. Save corrected mapping for future training
-            CategoryData.objects.create(
-                category_name=corrected,
-                example_text=text
-            )
+    updated = len(corrections)
+    return Response({"updated": updated}, status=200)
 
-            # 2. Push to taxonomy-service for update
-            try:
-                requests.post(
-                    f"{TAXONOMY_URL}/taxonomy/update",
-                    json={"category": corrected, "example": text},
-                    timeout=5
-                )
-            except Exception:
-                pass
-
-            # 3. Update existing Transaction row(s)
-            Transaction.objects.filter(description=text).update(
-                user_label=corrected
+def relabel_transactions(corrections, chunk=500):
+    """Set user_label from a {description: label} dict with one
+    UPDATE ... FROM (VALUES ...) per `chunk` descriptions."""
+    items = list(corrections.items())
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), chunk):
+            part = items[start:start + chunk]
+            values = ', '.join(['(%s, %s)'] * len(part))
+            # unnamed VALUES columns are column1, column2 on PostgreSQL and SQLite alike
+            cursor.execute(
+                f"UPDATE {table} SET user_label = v.column2 FROM (VALUES {values}) AS v "
+                f"WHERE {table}.description = v.column1",
+                [value for pair in part for value in pair],
             )
 
-            updated += 1
-
-    return Response({"updated": updated}, status=200)
-
 # UploadBatch history viewset
 class UploadBatchViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UploadBatchSerializer
@@ -204,30 +146,28 @@ class UploadBatchViewSet(viewsets.ReadOnlyModelViewSet):
         user = self.request.user
         return UploadBatch.objects.order_by('-created_at')
 
+def export_transactions(request, fmt):
+    try:
+        return export_response(request, fmt)
+    except ExportError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET'])
 def export_transactions_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(["id", "description", "amount", "date", "predicted_category", "predicted_score", "user_label", "entities"])
-
-    for tx in Transaction.objects.all().order_by('-created_at'):
-        writer.writerow([
-            tx.id,
-            tx.description,
-            tx.amount,
-            tx.date,
-            tx.predicted_category,
-            tx.predicted_score,
-            tx.user_label,
-            json.dumps(tx.entities)
-        ])
-
-    return response
+    return export_transactions(request, 'csv')
 
 
 @api_view(['GET'])
 def export_transactions_json(request):
-    data = list(Transaction.objects.all().order_by('-created_at').values())
-    return JsonResponse(data, safe=False)
\ No newline at end of file
+    return export_transactions(request, 'json')
+
+
+@api_view(['GET'])
+def export_transactions_ndjson(request):
+    return export_transactions(request, 'ndjson')
+
+
+@api_view(['GET'])
+def taxonomy_outbox_metrics(request):
+    return Response(outbox_metrics())
@@ -0,0 +1,18 @@
+from django.urls import path
+
+from apps.transactions.views import (
+    export_transactions_csv,
+    export_transactions_json,
+    export_transactions_ndjson,
+    upload_stream,
+)
+from config.urls import urlpatterns as api_urlpatterns
+
+# URLconf of the ASGI service (django-stream, port 8301): the whole API plus
+# the streaming views, which only stream under ASGI
+urlpatterns = [
+    path("api/upload/stream/<int:batch_id>/", upload_stream),
+    path("api/transactions/export/csv/", export_transactions_csv),
+    path("api/transactions/export/json/", export_transactions_json),
+    path("api/transactions/export/ndjson/", export_transactions_ndjson),
+] + api_urlpatterns
@@ -33,7 +33,9 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
 ]
 
-ROOT_URLCONF = "config.urls"
+# config.urls under WSGI; asgi.py switches to config.asgi_urls, which adds
+# the streaming views (SSE progress, exports)
+ROOT_URLCONF = os.getenv("DJANGO_ROOT_URLCONF", "config.urls")
 
 TEMPLATES = [
     {
@@ -79,6 +81,11 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Bulk UploadItem / Transaction inserts use COPY FROM STDIN on PostgreSQL
+DB_BULK_COPY = os.getenv("DB_BULK_COPY", "True") == "True"
+# Transaction exports read this many rows per keyset page
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "2000"))
+
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
         "rest_framework.renderers.JSONRenderer",
@@ -89,5 +96,53 @@ REST_FRAMEWORK = {
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
 
+# Uploaded files are parsed while they arrive and inserted UPLOAD_INGEST_CHUNK
+# rows at a time; the batch task starts on the first rows and polls for more
+UPLOAD_INGEST_CHUNK = int(os.getenv("UPLOAD_INGEST_CHUNK", "2000"))
+UPLOAD_INGEST_POLL_SECONDS = int(os.getenv("UPLOAD_INGEST_POLL_SECONDS", "2"))
+# an ingest silent this long is taken as dead (its web process went away)
+UPLOAD_INGEST_STALE_SECONDS = int(os.getenv("UPLOAD_INGEST_STALE_SECONDS", "300"))
+# Upload batch processing streams items chunk by chunk. Past this RSS the task
+# flushes what it holds early, and the worker child is recycled after the task.
+UPLOAD_MEMORY_CEILING_MB = int(os.getenv("UPLOAD_MEMORY_CEILING_MB", "512"))
+CELERY_WORKER_MAX_MEMORY_PER_CHILD = UPLOAD_MEMORY_CEILING_MB * 1024  # KiB
+# A batch is fanned out over item id ranges of UPLOAD_RANGE_SIZE, with at most
+# UPLOAD_BATCH_CONCURRENCY range tasks of one batch running at a time
+UPLOAD_RANGE_SIZE = int(os.getenv("UPLOAD_RANGE_SIZE", "5000"))
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))
+# classify/bulk requests each range task keeps in flight while it writes
+UPLOAD_INFLIGHT_REQUESTS = int(os.getenv("UPLOAD_INFLIGHT_REQUESTS", "4"))
+# Bounds and target latencies for the adaptive classify chunk / write buffer
+# sizes, and the bounds of the classify request timeout derived from them
+UPLOAD_CLASSIFY_CHUNK_MIN = int(os.getenv("UPLOAD_CLASSIFY_CHUNK_MIN", "25"))
+UPLOAD_CLASSIFY_CHUNK_MAX = int(os.getenv("UPLOAD_CLASSIFY_CHUNK_MAX", "1000"))
+UPLOAD_CLASSIFY_TARGET_SECONDS = float(os.getenv("UPLOAD_CLASSIFY_TARGET_SECONDS", "2.0"))
+UPLOAD_CLASSIFY_TIMEOUT_MIN = float(os.getenv("UPLOAD_CLASSIFY_TIMEOUT_MIN", "10"))
+UPLOAD_CLASSIFY_TIMEOUT_MAX = float(os.getenv("UPLOAD_CLASSIFY_TIMEOUT_MAX", "60"))
+UPLOAD_WRITE_CHUNK_MIN = int(os.getenv("UPLOAD_WRITE_CHUNK_MIN", "100"))
+UPLOAD_WRITE_CHUNK_MAX = int(os.getenv("UPLOAD_WRITE_CHUNK_MAX", "5000"))
+UPLOAD_WRITE_TARGET_SECONDS = float(os.getenv("UPLOAD_WRITE_TARGET_SECONDS", "0.5"))
+
 TAXONOMY_HOST = os.getenv("TAXONOMY_HOST", "http://localhost:8200")
 TAXONOMY_HOST_BULK = os.getenv("TAXONOMY_HOST_BULK", TAXONOMY_HOST)
+# Consecutive failed taxonomy calls (across all workers) that open the
+# circuit, and how long it stays open before a probe call is let through
+TAXONOMY_BREAKER_THRESHOLD = int(os.getenv("TAXONOMY_BREAKER_THRESHOLD", "5"))
+TAXONOMY_BREAKER_RESET_SECONDS = int(os.getenv("TAXONOMY_BREAKER_RESET_SECONDS", "30"))
+# Taxonomy examples go through an outbox table: drained every
+# TAXONOMY_OUTBOX_INTERVAL_SECONDS (and after each save) in batches of
+# TAXONOMY_OUTBOX_BATCH, a row given up on after TAXONOMY_OUTBOX_MAX_ATTEMPTS
+# failed calls; retries back off from the interval up to
+# TAXONOMY_OUTBOX_MAX_BACKOFF_SECONDS. Sent rows are deleted
+# TAXONOMY_OUTBOX_RETENTION_SECONDS after they went out
+TAXONOMY_OUTBOX_BATCH = int(os.getenv("TAXONOMY_OUTBOX_BATCH", "500"))
+TAXONOMY_OUTBOX_MAX_ATTEMPTS = int(os.getenv("TAXONOMY_OUTBOX_MAX_ATTEMPTS", "20"))
+TAXONOMY_OUTBOX_INTERVAL_SECONDS = float(os.getenv("TAXONOMY_OUTBOX_INTERVAL_SECONDS", "30"))
+TAXONOMY_OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("TAXONOMY_OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+TAXONOMY_OUTBOX_RETENTION_SECONDS = float(os.getenv("TAXONOMY_OUTBOX_RETENTION_SECONDS", "86400"))
+CELERY_BEAT_SCHEDULE = {
+    "drain-taxonomy-outbox": {
+        "task": "apps.transactions.tasks.drain_taxonomy_outbox",
+        "schedule": TAXONOMY_OUTBOX_INTERVAL_SECONDS,
+    },
+}
@@ -6,11 +6,9 @@ from apps.transactions.views import (
     CategoryDataViewSet,
     TransactionViewSet,
     UploadBatchViewSet,
-    export_transactions_csv,
-    export_transactions_json,
+    taxonomy_outbox_metrics,
     low_confidence_submit,
     upload_file,
-    upload_stream,
 )
 
 router = routers.DefaultRouter()
@@ -18,12 +16,12 @@ router.register(r"transactions", TransactionViewSet, basename="transaction")
 router.register(r"category-data", CategoryDataViewSet, basename="categorydata")
 router.register(r"batches", UploadBatchViewSet, basename="batches")
 
+# SSE progress and exports live in config/asgi_urls.py: they stream from
+# async iterators, which a WSGI server would collect into memory first
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(router.urls)),
     path("api/upload/", upload_file),
-    path("api/upload/stream/<int:batch_id>/", upload_stream),
     path("api/low-confidence/submit/", low_confidence_submit),
-    path("api/transactions/export/csv/", export_transactions_csv),
-    path("api/transactions/export/json/", export_transactions_json),
+    path("api/taxonomy/outbox/metrics/", taxonomy_outbox_metrics),
 ]
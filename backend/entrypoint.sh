@@ -3,4 +3,6 @@ set -e
 
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput || true
+# WSGI, so uploads are parsed while the body arrives (see apps/transactions/ingest.py).
+# Progress streams and exports are served by the ASGI django-stream service.
 exec gunicorn config.wsgi:application --bind 0.0.0.0:8300 --workers 2
@@ -79,10 +79,10 @@ export default function App(){
       {match && (
         <div className="card">
           <h3>Suggestion</h3>
-          <div><strong>Category:</strong> {match.category.name} ({match.score.toFixed(3)})</div>
+          <div><strong>Category:</strong> {match.category ? `${match.category.name} (${match.score.toFixed(3)})` : 'no match'}</div>
           <div><strong>Entities:</strong> {match.entities.map(e => `${e.text} [${e.label}]`).join(', ')}</div>
           <div style={{marginTop:8}}>
-            <button onClick={() => handleSave(match.category.name)}>Accept suggestion (save)</button>
+            {match.category && <button onClick={() => handleSave(match.category.name)}>Accept suggestion (save)</button>}
             <button onClick={() => {
               const userLabel = prompt("Enter correct category name")
               if(userLabel) handleSave(userLabel)
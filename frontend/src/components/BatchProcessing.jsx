@@ -3,6 +3,8 @@ import axios from 'axios'
 import LowConfidenceReview from "./LowConfidenceReview";
 
 const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8300'
+// progress streams from the ASGI service
+const STREAM_BASE = import.meta.env.VITE_STREAM_URL || 'http://localhost:8301'
 
 export default function BulkUpload() {
   const [file, setFile] = useState(null)
@@ -47,12 +49,14 @@ export default function BulkUpload() {
   }
 
   function startSSE(bid) {
-    const url = `${API_BASE}/api/upload/stream/${bid}/`
+    const url = `${STREAM_BASE}/api/upload/stream/${bid}/`
     const es = new EventSource(url)
 
+    // the first message is the whole batch, later ones only what changed
+    const data = {}
     es.onmessage = (e) => {
       try {
-        const data = JSON.parse(e.data)
+        Object.assign(data, JSON.parse(e.data))
         setStatus(`Status: ${data.status}`)
 
         if (data.total_items) {
@@ -70,6 +74,11 @@ export default function BulkUpload() {
           es.close()
         }
 
+        if (data.error) {
+          setStatus(`Progress unavailable (${data.error})`)
+          es.close()
+        }
+
       } catch (err) {
         console.error('SSE parse', err)
       }
@@ -2,6 +2,8 @@ import React, { useEffect, useState } from "react";
 import axios from "axios";
 
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:8300";
+// exports stream from the ASGI service
+const STREAM_BASE = import.meta.env.VITE_STREAM_URL || "http://localhost:8301";
 
 export default function TransactionList() {
   const [transactions, setTransactions] = useState([]);
@@ -28,14 +30,14 @@ export default function TransactionList() {
 
       <div style={{ marginBottom: 20 }}>
         <a
-          href={`${API_BASE}/api/transactions/export/csv/`}
+          href={`${STREAM_BASE}/api/transactions/export/csv/`}
           download
         >
           <button>Download CSV</button>
         </a>
 
         <a
-          href={`${API_BASE}/api/transactions/export/json/`}
+          href={`${STREAM_BASE}/api/transactions/export/json/`}
           download
           style={{ marginLeft: 10 }}
         >